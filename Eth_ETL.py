@@ -3,6 +3,7 @@ import json
 import requests
 import logging
 import pandas as pd
+import numpy as np
 import hexbytes
 import utils
 import datetime 
@@ -11,13 +12,19 @@ import hashlib
 import eth_abi 
 from functools import wraps
 import time
+import async_rpc
+import http_session
+import block_cache
+import metadata_store
+import contract_cache
+import signature_db
+import proxy_resolver
+import etherscan_broker
+import block_stream
 # now = datetime.datetime.now()
 # # Format the date to 'day-month-year'
 # DATE = now.strftime('%d%m%y')
 
-#global switch for fetching abis 
-RETRY_UNVERIFIED=False
-
 logger = logging.getLogger(__name__)
 
 
@@ -52,32 +59,49 @@ def retry_on_not_200(max_retries=10, delay=2):
         return wrapper
     return decorator
 
-# functions for handling empty logs
-def retry_on_empty(max_retries=10, delay=2):
-    """
-    Decorator to retry a function that makes an getlog request again if the log is empty
-
-    :param max_retries: Maximum number of retry attempts.
-    :param delay: Delay between retries in seconds.
-    """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                response = func(*args, **kwargs)
-                if len(response)>0:
-                    return response
-                print(f"Attempt {attempt + 1} of {max_retries} as empty logs were returned. Retrying in {delay} seconds...")
-                time.sleep(delay)
-            print("Max retries reached. Request failed.")
-            return None
-        return wrapper
-    return decorator
-
 
 MAX_TRIES = 10
 TIME_DELAY = 2 # seconds
 
+# block range planning for trace_filter (AIMD: grow the chunk additively on fast responses, halve it on timeouts / oversized results)
+TRACE_FILTER_CHUNK = 100 # initial chunk size in blocks, ~100 blocks fit in the default server-side timeout (timeout=5s, Alchemy)
+TRACE_FILTER_MAX_CHUNK = 2000
+TRACE_FILTER_STEP = 50 # additive increase (blocks)
+TRACE_FILTER_FAST = 2 # seconds, responses faster than this grow the chunk
+TRACE_FILTER_TIMEOUT = 60 # seconds, client-side timeout for a single chunk
+
+# error messages from rpc providers that mean the block range has to be made smaller (result size / server-side timeout only,
+# other errors such as an invalid range or exhausted credits must not be bisected)
+RANGE_LIMIT_HINTS = ['timeout', 'timed out', 'query returned more than', 'too many results', 'response size', 'response is too big', 'range too large', 'block range is too large']
+
+
+# eth_getLogs range planning, providers cap the block range of a single eth_getLogs request (2k blocks for Alchemy)
+LOGS_WINDOW = 2000 # blocks
+
+
+# number of watchlist addresses sent in a single eth_getLogs / trace_filter request (--combined mode)
+COMBINED_ADDR_BATCH = 100
+
+
+# range jobs (traces_range, txs_range, contracts_range) : progress is logged every RANGE_PROGRESS_EVERY blocks
+RANGE_PROGRESS_EVERY = 100
+
+
+def plan_block_windows(start_block, end_block, window):
+    # split [start_block, end_block] into consecutive windows of at most `window` blocks
+    windows = []
+    cursor = int(start_block)
+    end_block = int(end_block)
+    while cursor <= end_block:
+        windows.append((cursor, min(cursor + window - 1, end_block)))
+        cursor += window
+    return windows
+
+
+def is_range_limit_error(error_msg):
+    error_msg = str(error_msg).lower()
+    return any(hint in error_msg for hint in RANGE_LIMIT_HINTS)
+
 
 
 class Eth_tracker():
@@ -91,92 +115,125 @@ class Eth_tracker():
         self.contracts = contracts
         self.apis = apis
         self.DATE = DATE
+        # raw block data of finalized blocks is served from a local cache (see block_cache.py)
+        self.block_cache = block_cache.get_block_cache(self.w3)
+        # abis, bytecode flags and proxy mappings (see metadata_store.py)
+        self.store = metadata_store.get_store('./')
+        self.signatures = signature_db.get_signature_db('./')
+        self.proxies = proxy_resolver.get_proxy_resolver(self.w3, self.store)
+        self.etherscan = etherscan_broker.get_broker()
+        # set to a list to collect the paths of the written results (follow mode retracts them when their block is orphaned)
+        self.written = None
+        # range jobs / follow mode only read the block cache unless this is set (--cache_blocks), a sweep over millions of blocks would fill the disk
+        self.cache_range_blocks = False
         logger.info('eth etl class initialized')
 
-    def fetch_blockinfo(self):
-
-        blockinfo = self.w3.eth.get_block(self.block_id)
-        logger.info(f'block fetched, block id: {self.block_id}')
+    def fetch_blockinfo(self, full_transactions=False, block_id=None, cache_write=True):
+        # with full_transactions=True the block carries the transaction objects themselves (one round trip for the whole block)
+        # block_id defaults to the block of the job (range jobs pass the block they fetch ahead)
+        block_id = self.block_id if block_id is None else block_id
+        kind = 'block_full' if full_transactions else 'block'
+        blockinfo = self.block_cache.read_through(kind, block_id, 
+                                                  lambda: self.w3.eth.get_block(block_id, full_transactions=full_transactions),
+                                                  lambda block: block['hash'].hex(), write=cache_write)
+        logger.info(f'block fetched, block id: {block_id}')
         # print(blockinfo)
         
         return blockinfo
         
     @retry_on_not_200(max_retries=MAX_TRIES , delay=TIME_DELAY)
     def send_request(self, url, request_body):
-        response = requests.post(url, json=request_body,timeout=None)
+        response = http_session.post(url, json=request_body,timeout=None)
         return response
     
     @retry_on_not_200(max_retries=MAX_TRIES, delay=TIME_DELAY)
     def get_url(self, url):
-        response = requests.get(url, timeout=None)
+        response = http_session.get(url, timeout=None)
         return response
 
 
-    def fetch_blocktrace(self, rpc_provider):
+    def fetch_blocktrace(self, rpc_provider, block_id=None, cache_write=True):
+        block_id = self.block_id if block_id is None else block_id
+        blocktrace = self.block_cache.read_through('trace_block', block_id,
+                                                   lambda: self._fetch_rpc_result(rpc_provider, "trace_block", [str(block_id)]),
+                                                   lambda traces: traces[0]['blockHash'] if len(traces) else None, write=cache_write)
+
+        logger.info(f'traces for the block fetched, block id: {block_id}')
         
+        return blocktrace
+    
+    def _fetch_rpc_result(self, rpc_provider, method, params):
         url = f"{rpc_provider}"
         
         request={
                     "jsonrpc":"2.0",
-                    "method":"trace_block",
-                    "params":[str(self.block_id)],
+                    "method":method,
+                    "params":params,
                     "id":1
                 }
         
         response = self.send_request(url, request)
         res = response.json()
 
-        blocktrace = res['result']
-
-        logger.info(f'traces for the block fetched, block id: {self.block_id}')
-        
-        return blocktrace
+        return res['result']
     
     
     def get_transactions(self, blockinfo):    
-        tx_hashes = blockinfo['transactions']
-        collect=pd.DataFrame()
+        # blockinfo['transactions'] holds either tx hashes (fetch_blockinfo()) or full tx objects (fetch_blockinfo(full_transactions=True))
+        txs = blockinfo['transactions']
+        collect=utils.Row_accumulator()
         collect_keys=['hash', 'from', 'to', 'input']
-        for tx_hash in tx_hashes:
+        for tx in txs:
             summary ={}
-            tx = self.w3.eth.get_transaction(tx_hash)
+            if(isinstance(tx, (bytes, str))): # only the hash is known, fetch the transaction (one round trip per tx)
+                tx = self.w3.eth.get_transaction(tx)
             # print(tx)
             for key in collect_keys:
                 if(key=='hash'):
                     summary[key]=tx[key].hex()
-                elif((key=='to') & (key not in tx.keys())):
-                    logger.info(f'found a contract creation event for tx(hash) : {tx_hash.hex()}')
+                elif((key=='to') & ((key not in tx.keys()) or (tx[key] is None))):
+                    logger.info(f'found a contract creation event for tx(hash) : {tx["hash"].hex()}')
                     summary[key]='contract_created'
                 else:
                     summary[key]=tx[key]
             
-            summary = pd.DataFrame(summary, index=[0])
-            collect=pd.concat([collect, summary])
-        collect=collect.reset_index(drop='index') 
+            collect.append(summary)
+        collect=collect.to_frame() 
         logger.info(f"exported {len(collect)} transactions")
         return collect
     
 
     def get_trace_actions(self, blocktrace):    
-        collect=pd.DataFrame()
+        collect=utils.Row_accumulator()
         for action in blocktrace:
             summary ={}
             keys = action['action'].keys()
             for key in keys:
                 summary[key]=action['action'][key]
 
-            summary = pd.DataFrame(summary, index=[0])
-            collect=pd.concat([collect, summary])
-        collect=collect.reset_index(drop='index')
+            collect.append(summary)
+        collect=collect.to_frame()
         logger.info(f"exported {len(collect)} transactions")
         return collect
     
+    def match_watchlist(self, collect, addr_pos):
+        """
+        one vectorized membership join of the normalized (lower-cased) watchlist against the addr_pos column.
+        returns {normalized address : [row positions]} for the addresses that matched
+        """
+        watchlist = {search_entry.lower() for search_entry in self.contracts}
+        keys = collect[addr_pos].astype(str).str.lower()
+        hits = pd.DataFrame({'key': keys.values, 'row': np.arange(len(collect))})
+        hits = hits[hits['key'].isin(watchlist)]
+        return hits.groupby('key', sort=False)['row'].apply(list).to_dict()
+
 ### finding interacting contracts(traces)  + input data
     def find_interacting_traces(self, actions, blocktrace, ETHERSCAN_API=None, addr_pos='to'):
+        matches = self.match_watchlist(actions, addr_pos)
         for search_entry in self.contracts:
             logger.info(f'searching for contract {search_entry} in {addr_pos} position')
-            # find contracts calling the target contract
-            index = actions.loc[actions['to']==search_entry.lower()].index
+            # find traces calling (to) / called by (from) the target contract
+            index = matches.get(search_entry.lower(), [])
             if(len(index)):
                 logger.info(f"{len(index)} match(es) was(were) found for the contract {search_entry}")
                 for ind in index:    
@@ -188,10 +245,11 @@ class Eth_tracker():
             
 ### finding interacting contracts + input data
     def find_interacting_contracts(self, collect, ETHERSCAN_API=None, addr_pos='to'):
+        matches = self.match_watchlist(collect, addr_pos)
         for search_entry in self.contracts:
             logger.info(f'searching for contract {search_entry} in {addr_pos} position')
             # find contracts calling the target contract
-            subset = collect.loc[collect[addr_pos]==search_entry]
+            subset = collect.iloc[matches.get(search_entry.lower(), [])]
             if(len(subset)):
                 logger.info(f"{len(subset)} match(es) was(were) found for the contract {search_entry}")
                 # check if the interacting address is a contract
@@ -204,9 +262,10 @@ class Eth_tracker():
 
 ### finding interacting contracts adresses (no input data)
     def find_interacting_addrs(self, collect, addr_pos='to'):
+        matches = self.match_watchlist(collect, addr_pos)
         for search_entry in self.contracts:
             logger.info(f'searching for contract {search_entry} in {addr_pos} position')
-            subset = collect.loc[collect[addr_pos]==search_entry]
+            subset = collect.iloc[matches.get(search_entry.lower(), [])]
             if(len(subset)):
                 logger.info(f"{len(subset)} match(es) was(were) found for the contract {search_entry}")
                 subset = subset[['hash', 'from', 'to']]
@@ -216,52 +275,29 @@ class Eth_tracker():
 
 
     def get_proxy_mapping(self, addr:str, ETHERSCAN_API=None):
-
-        # make/check local cache 
-        cached_file = f"./proxy_mapping/{addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                impl_addr = json.load(infile)
-                logger.info(f"using cached bytecode (implementation contract) {impl_addr}")
-                
-        else:
-             # for openzeppelin upgradable template
-            padded = Web3.toHex(self.w3.eth.get_storage_at(addr, "0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3"))
-            padded = padded[-42:]
-            impl_addr = '0x' + padded[2:]
-            
-            # in case, needed we can check the value of impl_addr here.
-
-            logger.info(f'saving proxy mapping for {addr}')
-            utils.check_dir(f"./proxy_mapping")
-            with open(cached_file, 'w') as outfile:
-                json.dump(impl_addr, outfile)
-                
+        # openzeppelin, erc-1967 and UUPS patterns are checked in one JSON-RPC batch (see proxy_resolver.py)
+        impl_addr = self.proxies.resolve(addr)
         return impl_addr
 
             
 
     def get_contract_abi(self, addr:str, ETHERSCAN_API=None):
         
-        # make/check local cache 
-        cached_file = f"./bytecode/{addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                code = json.load(infile)
-                print(f"using cached bytecode for {addr}")
+        # check local cache (only the is-contract flag and the code hash are kept)
+        cached = self.store.get_code(addr)
+        if cached is not None:
+            is_contract, code_hash = cached
+            print(f"using cached bytecode for {addr}")
             
         else:
             print(f"fetching bytecode for {addr}")
             code = self.w3.eth.get_code(addr) # expensive when using rpc services 
-
-            utils.check_dir(f"./bytecode")
-            with open(cached_file, 'w') as outfile:
-                json.dump(code.hex(), outfile)
-                print('bytecode saved')
+            is_contract, code_hash = self.store.put_code(addr, code)
+            print('bytecode saved')
 
 
         # Check if the address is a contract account
-        if code == '0x':
+        if not is_contract:
             print(f"{addr} is an EOA")
             return None, 'eoa'
         else:
@@ -271,39 +307,19 @@ class Eth_tracker():
         
 
     def decode_input(self, hex_input, contract_addr, contract_abi):
-        contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi)
-
-        # check if it is a proxy contract 
-        impl_check = 'implementation' in contract_abi.lower()
-        upgrade_check = 'upgrade' in contract_abi.lower()
-        verdict = impl_check and upgrade_check
-        if(verdict):
-            logger.info(f'found a proxy contract ({contract_addr}). Fetching the implementation function to get the matching contract (for now only openzeppelin upgradable proxy is handled.)')
-            # somehow nowadays proxy contracts prevent clients from calling implementation function directly.
-            #implementation_address = contract.functions.implementation().call()
-
-            # check first if there is cached data ("get_storage_at" can be expensive in terms of compute unit)
-
-            impl_addr = self.get_proxy_mapping(contract_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
-
-            # for openzeppelin upgradable template
-            # padded = Web3.toHex(self.w3.eth.get_storage_at(contract_addr, "0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3"))
-            # padded = padded[-42:]
-            # impl_addr = '0x' + padded[2:]
-            
-            if(impl_addr=='0x0000000000000000000000000000000000000000'):
-                logger.info(f'found a proxy but {contract_addr} is not using openzeppelin upgradable contract... moving on')
-                func = hex_input[:10]
-                params = 'unknown_proxy' 
-                return func, params
-
-            else:
-                logger.info(f'found a proxy contract that probably is using openzeppelin upgradable contract')
-                impl_addr = Web3.to_checksum_address(impl_addr)
-                contract_abi, verdict = self.get_contract_abi(impl_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
-                contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi)
+        # parsed abi, proxy verdict, implementation abi and the Contract object are memoized per contract (see contract_cache.py)
+        entry = contract_cache.get_contract_entry(self, contract_addr, contract_abi)
+
+        if(entry.unknown_proxy):
+            logger.info(f'found a proxy but {contract_addr} is not using a known upgradable proxy pattern... moving on')
+            func = hex_input[:10]
+            params = 'unknown_proxy' 
+            return func, params
+        if(entry.decoder is None):
+            raise ValueError(f'ABI of the implementation contract {entry.impl_addr} (proxy : {contract_addr}) is not available')
         
-        func, params = contract.decode_function_input(hex_input)
+        # selector lookup + eth_abi decode (same (function, params) shape as contract.decode_function_input)
+        func, params = entry.decoder.decode(hex_input)
 
         return func, params
     
@@ -322,7 +338,13 @@ class Eth_tracker():
             inner['to']= collect_subset['to']
             write['output']=inner
         else:
-            func, params = self.decode_input(collect_subset['input'], collect_subset['to'], contract_abi)
+            try:
+                func, params = self.decode_input(collect_subset['input'], collect_subset['to'], contract_abi)
+            except Exception as e:
+                # e.g. plain ether transfers (input 0x) or selectors missing from the (implementation) abi : keep the raw selector
+                logger.error(f"input could not be decoded. tx_hash: {collect_subset['hash']}, keeping the raw selector. Error raised : {e}")
+                func = collect_subset['input'][:10]
+                params = 'ABI_reading_problem'
             inner={}
             inner['transaction_hash']=collect_subset['hash']
             inner['from']=collect_subset['from']
@@ -338,13 +360,21 @@ class Eth_tracker():
             write['output']=inner
         
         utils.check_dir(f"./output/{self.DATE}/tx/")
-        with open(f"./output/{self.DATE}/tx/block_id_{self.block_id}_{addr_pos}_contract_addr_{search_entry}_tx_{inner['transaction_hash']}.txt", 'w') as outfile:
+        out_file = f"./output/{self.DATE}/tx/block_id_{self.block_id}_{addr_pos}_contract_addr_{search_entry}_tx_{inner['transaction_hash']}.txt"
+        with open(out_file, 'w') as outfile:
             json.dump(write, outfile)
+        self.record_output(out_file)
         logger.info(f"results (contracts that were calling the target contract) for {self.block_id} and the contract {search_entry} was successfully saved")
 
+    def record_output(self, out_file):
+        if(self.written is not None):
+            self.written.append(out_file)
+
     def write_result_addrs(self, search_entry, subset, addr_pos):
         utils.check_dir(f"./output/{self.DATE}/addrs")
-        subset.to_csv(f"./output/{self.DATE}/addrs/block_id_{self.block_id}_{addr_pos}_contract_addr_{search_entry}.csv", index=False)
+        out_file = f"./output/{self.DATE}/addrs/block_id_{self.block_id}_{addr_pos}_contract_addr_{search_entry}.csv"
+        subset.to_csv(out_file, index=False)
+        self.record_output(out_file)
         logger.info(f"results for the contract {search_entry} was successfully saved")
 
 
@@ -405,8 +435,10 @@ class Eth_tracker():
                 
             write['trace']=inner
         utils.check_dir(f"./output/{self.DATE}/traces")
-        with open(f"./output/{self.DATE}/traces/block_id_{self.block_id}_{addr_pos}_contract_addr_{search_entry}_trace_index_{action_subset.name}.txt", 'w') as outfile:
+        out_file = f"./output/{self.DATE}/traces/block_id_{self.block_id}_{addr_pos}_contract_addr_{search_entry}_trace_index_{action_subset.name}.txt"
+        with open(out_file, 'w') as outfile:
             json.dump(write, outfile)
+        self.record_output(out_file)
         logger.info(f"results (traces that were calling the target contract) for {self.block_id} and the contract {search_entry} was successfully saved")
 
     
@@ -414,43 +446,38 @@ class Eth_tracker():
     
     def get_abi(self, contract_addr:str, ETHERSCAN_API=None, contract_type=None):
         # check its its cached/called before
-        cached_file = f"./abis/{contract_addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                try:
-                    abi_result = json.load(infile)
-                    if RETRY_UNVERIFIED==False and abi_result=='Contract source code not verified': # --> abi not usable.
-                        logger.info(f'ABI fetching step is ignored for {contract_addr} as previous attempts were not successful. In case you want to force fetching please set global var RETRY_UNVERIFIED to True in Eth_ETL.py')
-                        return 
-                    else:
-                        if not('Max rate limit reached' in abi_result): # checks for previous rate limit problem
-                            print("using cached abi")
-                            return abi_result
-                except Exception as e:
-                    logger.error(e)
-                    logger.error(f'saved ABI was not in a proper format for: {contract_addr}')
-
-        url = f"https://api.etherscan.io/api?module=contract&action=getabi&address={contract_addr}&apikey={ETHERSCAN_API}"
-        response = self.get_url(url)
-        res = response.json()
-
+        cached = self.store.get_abi(contract_addr)
+        if cached is not None:
+            verified, abi_result = cached
+            if not verified: # --> abi not usable.
+                logger.info(f'ABI fetching step is ignored for {contract_addr} as previous attempts were not successful. The contract is looked up again after metadata_store.NEGATIVE_TTL seconds')
+                return 
+            else:
+                print("using cached abi")
+                return abi_result
+
+        # requested once per address over all processes, rate shaped (see etherscan_broker.py)
+        fetched = self.etherscan.fetch('getabi', contract_addr, ETHERSCAN_API,
+                                       lookup=lambda: self.store.get_abi(contract_addr),
+                                       handle=lambda res: self.save_abi_result(contract_addr, res))
+        if(fetched is None or not(fetched[0])):
+            return # contract cannot be initialized with abi (could use function signatures for targeted approach)
+        return str(fetched[1])
 
+    def save_abi_result(self, contract_addr, res):
+        # stores an etherscan getabi answer, returns (verified, abi or error msg) like store.get_abi
+        if(res is None):
+            logger.error(f'fetching abi for {contract_addr} from etherscan failed')
+            return None
         if res['status'] == '1':
-            utils.check_dir(f"./abis")
-            with open(cached_file, 'w') as outfile:
-                json.dump(res['result'], outfile)
-                print('abi saved')
-
-            return str(res['result'])
-            
+            self.store.put_abi(contract_addr, res['result'], verified=True)
+            print('abi saved')
+            return True, res['result']
         else:
             print(f"Error: {res['message']} Result: {res['result']}")    
-            utils.check_dir(f"./abis")
-            with open(cached_file, 'w') as outfile:
-                json.dump(res['result'], outfile)
-                print(f'There was an error when fetching abi for {contract_addr}, saved the error msg in abi folder')
-            
-            return # contract cannot be initialized with abi (could use function signatures for targeted approach)
+            self.store.put_abi(contract_addr, str(res['result']), verified=False)
+            print(f'There was an error when fetching abi for {contract_addr}, saved the error msg as a negative entry')
+            return False, str(res['result'])
     
     
     
@@ -463,40 +490,85 @@ class Eth_tracker():
             
         return contract_abi, verdict
     
-    @retry_on_empty(max_retries=MAX_TRIES, delay=TIME_DELAY)
-    def get_logs_try(self, filter_params):
-        logs = self.w3.eth.get_logs(filter_params)
-        return logs
+    def _get_logs_window(self, args, search_addr, start_block, end_block):
+        """
+        eth_getLogs for a single block window. An empty list is a valid result.
+        windows that hit the provider's result-size limit are bisected, returns None if the window could not be fetched.
+        """
+        filter_params = self.make_filter(args, search_addr, start_block, end_block)
+        for attempt in range(MAX_TRIES):
+            try:
+                return list(self.w3.eth.get_logs(filter_params))
+            except Exception as e:
+                if(is_range_limit_error(e)):
+                    if(start_block == end_block):
+                        logger.error(f'logs of the single block {start_block} exceed the provider limits : {e}')
+                        return None
+                    mid = (start_block + end_block) // 2
+                    logger.info(f'block window {start_block} - {end_block} exceeded the provider limits, splitting it at {mid}')
+                    first = self._get_logs_window(args, search_addr, start_block, mid)
+                    second = self._get_logs_window(args, search_addr, mid + 1, end_block)
+                    if(first is None or second is None):
+                        return None
+                    return first + second
+                print(f"Attempt {attempt + 1} of {MAX_TRIES} encountered an error ({e}). Retrying in {TIME_DELAY} seconds...")
+                time.sleep(TIME_DELAY)
+        logger.error(f'Max retries reached. eth_getLogs failed for the block window {start_block} - {end_block}')
+        return None
+
+    def merge_window_logs(self, window_logs):
+        # merge per-window results, deduplicated on (blockNumber, logIndex). returns None if any window failed
+        if(any(logs is None for logs in window_logs)):
+            return None
+        merged = {}
+        for logs in window_logs:
+            for log in logs:
+                key = (log['blockNumber'], log['logIndex'])
+                if(key not in merged):
+                    merged[key] = log
+        return [merged[key] for key in sorted(merged)]
+
+    def get_logs_range(self, args, search_addr):
+        # sequential version of the windowed eth_getLogs (used inside jobs that are already parallel per address)
+        windows = plan_block_windows(args.start_block, args.end_block, LOGS_WINDOW)
+        return self.merge_window_logs([self._get_logs_window(args, search_addr, start, end) for start, end in windows])
 
 
     def get_blocks_filter(self, args, search_addr):
         # check if its in checksum address
         search_addr = Web3.to_checksum_address(search_addr) 
-        filter_params = self.make_filter(args, search_addr)
         #get logs
-        logs = self.get_logs_try(filter_params)
-        if(len(logs)>0):
+        logs = self.get_logs_range(args, search_addr)
+        if(logs is None):
+            logger.error(f'fetching logs failed for the address : {search_addr}')
+            return None
+        elif(len(logs)>0):
             logger.info(f'got filter logs for the address : {search_addr}')
             # get target blocks
             target_blocks = self.extract_blocks_from_logs(logs)
             return target_blocks
         else:
-            logger.error(f'returned logs were empty')
+            logger.info(f'returned logs were empty')
             return None
         
     def _get_logs_filter(self, args, search_addr):
         # check if its in checksum address
         search_addr = Web3.to_checksum_address(search_addr) 
-        filter_params = self.make_filter(args, search_addr)
         #get logs
-        logs = self.get_logs_try(filter_params)
-        if(len(logs)>0):
+        logs = self.get_logs_range(args, search_addr)
+        return self._format_logs_result(logs, search_addr)
+
+    def _format_logs_result(self, logs, search_addr):
+        if(logs is None):
+            logger.error(f'fetching logs failed for the address : {search_addr}')
+            return None
+        elif(len(logs)>0):
             logger.info(f'got filter logs for the address : {search_addr}')
             # get target blocks
             formatted = self.format_logs(logs)
             return formatted
         else:
-            logger.error(f'returned logs were empty')
+            logger.info(f'returned logs were empty')
             return None
 
 
@@ -536,11 +608,14 @@ class Eth_tracker():
         
 
         
-    def make_filter(self, args, search_addr):
-        if(len(args.topics)>0):
-            return {'fromBlock': int(args.start_block), 'toBlock': int(args.end_block), 'address': search_addr, 'topics': args.topics} #topics is the list of keccak256 encoded function signatures
+    def make_filter(self, args, search_addr, start_block=None, end_block=None):
+        from_block = int(args.start_block if start_block is None else start_block)
+        to_block = int(args.end_block if end_block is None else end_block)
+        topics = getattr(args, 'topics', None)
+        if(topics is not None and len(topics)>0):
+            return {'fromBlock': from_block, 'toBlock': to_block, 'address': search_addr, 'topics': topics} #topics is the list of keccak256 encoded function signatures
         else:
-            return {'fromBlock': int(args.start_block), 'toBlock': int(args.end_block), 'address': search_addr}
+            return {'fromBlock': from_block, 'toBlock': to_block, 'address': search_addr}
 
     def save_interim_filter_res(self, blocks_of_int, CONTRACTS_BK, args):
         hashed = self.get_hash_of_list(CONTRACTS_BK)
@@ -586,29 +661,86 @@ class Eth_tracker():
         return blocks_of_int
     
     def get_target_logs(self, CONTRACTS_BK, args):
+        cache_root = f'./output/{self.DATE}/{args.start_block}_{args.end_block}/logs'
+        pending = []
         for search_addr in CONTRACTS_BK:
-            logger.info(f'getting logs for the address : {search_addr}, starting block : {args.start_block} ending block : {args.end_block}')
             # check if its cached
-            cache_root = f'./output/{self.DATE}/{args.start_block}_{args.end_block}/logs'
             cache_file = f'{cache_root}/{search_addr}.csv'
-            
             if(os.path.exists(cache_file)):
                 logger.info(f'logs for the address : {search_addr} was already exported for the given block range')
-                
             else:
-                target_logs = self._get_logs_filter(args, search_addr)
-                
-                if(target_logs is not None):
-                    logger.info(f'found {len(target_logs)} log entries for addr : {search_addr}')
-                    utils.check_dir(cache_root)
-                    target_logs.to_csv(cache_file, index=False)
-                    logger.info(f'exporting done.')
-                else:
-                    logger.error(f'no logs were found for the given range of blocks')
+                pending.append(search_addr)
+
+        if(getattr(args, 'combined', False)):
+            results = self._get_logs_combined(pending, args)
+        else:
+            # split the range into provider-safe windows and keep several eth_getLogs requests in flight
+            windows = plan_block_windows(args.start_block, args.end_block, LOGS_WINDOW)
+            calls = []
+            for search_addr in pending:
+                logger.info(f'getting logs for the address : {search_addr}, starting block : {args.start_block} ending block : {args.end_block} ({len(windows)} block windows)')
+                checksum_addr = Web3.to_checksum_address(search_addr)
+                calls += [(self._get_logs_window, (args, checksum_addr, start, end)) for start, end in windows]
+            engine = async_rpc.Async_RPC(getattr(args, 'max_in_flight', async_rpc.MAX_IN_FLIGHT))
+            window_logs = engine.run(calls)
+
+            results = []
+            for ii, search_addr in enumerate(pending):
+                logs = self.merge_window_logs(window_logs[ii*len(windows):(ii+1)*len(windows)])
+                results.append(self._format_logs_result(logs, search_addr))
+
+        for search_addr, target_logs in zip(pending, results):
+            cache_file = f'{cache_root}/{search_addr}.csv'
+            if(target_logs is not None):
+                logger.info(f'found {len(target_logs)} log entries for addr : {search_addr}')
+                utils.check_dir(cache_root)
+                target_logs.to_csv(cache_file, index=False)
+                logger.info(f'exporting done.')
+            else:
+                logger.error(f'no logs were found for the given range of blocks')
     
             
     
     
+    def _get_logs_combined(self, pending, args):
+        """
+        one eth_getLogs per block window for a whole batch of addresses (address array filter),
+        the combined result is split back per address. returns formatted logs in the order of `pending`
+        """
+        windows = plan_block_windows(args.start_block, args.end_block, LOGS_WINDOW)
+        addr_batches = [pending[ii:ii+COMBINED_ADDR_BATCH] for ii in range(0, len(pending), COMBINED_ADDR_BATCH)]
+        calls = []
+        for addr_batch in addr_batches:
+            logger.info(f'getting logs for {len(addr_batch)} addresses in a single filter, starting block : {args.start_block} ending block : {args.end_block} ({len(windows)} block windows)')
+            checksum_batch = [Web3.to_checksum_address(search_addr) for search_addr in addr_batch]
+            calls += [(self._get_logs_window, (args, checksum_batch, start, end)) for start, end in windows]
+        engine = async_rpc.Async_RPC(getattr(args, 'max_in_flight', async_rpc.MAX_IN_FLIGHT))
+        window_logs = engine.run(calls)
+
+        results = []
+        for ii, addr_batch in enumerate(addr_batches):
+            logs = self.merge_window_logs(window_logs[ii*len(windows):(ii+1)*len(windows)])
+            demuxed = self.demux_by_address(logs, addr_batch, lambda log: log['address'])
+            for search_addr in addr_batch:
+                results.append(self._format_logs_result(demuxed[search_addr], search_addr))
+        return results
+
+    def demux_by_address(self, entries, addrs, get_addr):
+        # split a combined result back per watchlist address (case-insensitive), keeps the order of the entries
+        if(entries is None):
+            return {addr: None for addr in addrs}
+        demuxed = {addr: [] for addr in addrs}
+        lookup = {}
+        for addr in addrs:
+            lookup.setdefault(addr.lower(), []).append(addr)
+        for entry in entries:
+            entry_addr = get_addr(entry)
+            if(entry_addr is None):
+                continue
+            for addr in lookup.get(entry_addr.lower(), []):
+                demuxed[addr].append(entry)
+        return demuxed
+    
     def collect_logs(self, CONTRACTS_BK, args):
         logger.info('no cached logs exists for the current job')
         logs = []
@@ -630,7 +762,9 @@ class Eth_tracker():
         blocks_of_int= []
         for search_addr in CONTRACTS_BK:
             logger.info(f'applying a filter for the address : {search_addr}')
-            target_blocks = self.get_blocks_filter(args, search_addr)
+        engine = async_rpc.Async_RPC(getattr(args, 'max_in_flight', async_rpc.MAX_IN_FLIGHT))
+        results = engine.run([(self.get_blocks_filter, (args, search_addr)) for search_addr in CONTRACTS_BK])
+        for search_addr, target_blocks in zip(CONTRACTS_BK, results):
             if(target_blocks is None):
                 logger.error(f"returned logs were empty for address : {search_addr}")
             else:
@@ -642,7 +776,7 @@ class Eth_tracker():
         return blocks_of_int 
     
 
-    def make_trace_filter_params(self, args, search_addr):
+    def make_trace_filter_params(self, args, search_addr, start_block=None, end_block=None):
         if(isinstance(search_addr,list)):
             logger.info('applying trace filter using multiple addresses')
 
@@ -661,40 +795,106 @@ class Eth_tracker():
             logger.error("invalid pos argument. Please check if the pos argument is one of \"to\" or \"from\"")
         return_val =  [
                 {
-                "fromBlock": f"{hex(int(args.start_block))}",
-                "toBlock": f"{hex(int(args.end_block))}",
+                "fromBlock": f"{hex(int(args.start_block if start_block is None else start_block))}",
+                "toBlock": f"{hex(int(args.end_block if end_block is None else end_block))}",
                 pos_arg: search_list
                 }
             ]
     
         return return_val
-    # by heuristic, querying up until ~100 blocks is possible for the default server-side timeout (timeout=5s, Alchemy)
-    def send_trace_filter_req(self, args, search_addr):
+    def _send_trace_filter_chunk(self, args, search_addr, start_block, end_block):
+        """
+        single trace_filter request for [start_block, end_block] without retries.
+        returns (status, traces) where status is 'ok', 'split' (range too large for the provider) or 'retry'
+        """
         url = f"{self.apis['RPC_PROVIDER']}"
         
         req={
                 "id": 1,
                 "jsonrpc": "2.0",
                 "method": "trace_filter",
-                "params": self.make_trace_filter_params(args, search_addr)
+                "params": self.make_trace_filter_params(args, search_addr, start_block, end_block)
                   
                 }
-
-        response = self.send_request(url, req) 
-        if response.status_code == 200:
+        try:
+            response = http_session.post(url, json=req, timeout=TRACE_FILTER_TIMEOUT)
+        except requests.exceptions.Timeout:
+            return 'split', None
+        except requests.exceptions.RequestException as e:
+            logger.error(f'trace_filter request failed : {e}')
+            return 'retry', None
+
+        if(response.status_code in [408, 504]):
+            return 'split', None
+        if(response.status_code != 200):
+            logger.error(f'response code : {response.status_code}')
+            return 'retry', None
+        try:
             data = response.json()
-            if ('result' in data and len(data['result']) > 0):
-                length = len(data['result'])
-                logger.info(f'fetched {length} traces')
-                return data['result']
-            
+        except ValueError:
+            logger.error(f'trace_filter response was not a valid json')
+            return 'retry', None
+        if('error' in data):
+            if(is_range_limit_error(data['error'])):
+                return 'split', None
+            logger.error(f"trace_filter returned an error : {data['error']}")
+            return 'retry', None
+        return 'ok', data.get('result') or []
+
+    # by heuristic, querying up until ~100 blocks is possible for the default server-side timeout (timeout=5s, Alchemy).
+    # the range is therefore split into chunks whose size follows the provider's capacity (AIMD), chunks that time out are bisected.
+    # returns None if any chunk could not be fetched, so that incomplete results are never cached.
+    def send_trace_filter_req(self, args, search_addr):
+        end = int(args.end_block)
+        cursor = int(args.start_block)
+        chunk = TRACE_FILTER_CHUNK
+        attempt = 0
+        traces = []
+        while cursor <= end:
+            chunk_end = min(cursor + chunk - 1, end)
+            t_start = time.time()
+            status, result = self._send_trace_filter_chunk(args, search_addr, cursor, chunk_end)
+            elapsed = time.time() - t_start
+
+            if(status == 'split'):
+                if(chunk_end == cursor):
+                    # nothing is returned (and cached) for an incomplete range
+                    logger.error(f'trace_filter for the single block {cursor} exceeds the provider limits, the range {args.start_block} - {args.end_block} could not be fetched')
+                    return None
+                chunk = max((chunk_end - cursor + 1) // 2, 1) # multiplicative decrease
+                logger.info(f'block range {cursor} - {chunk_end} was too large for the provider, bisecting (chunk size : {chunk})')
+                continue
+
+            if(status == 'retry'):
+                attempt += 1
+                if(attempt >= MAX_TRIES):
+                    logger.error(f'Max retries reached. trace_filter failed for the block range {cursor} - {chunk_end}, the range {args.start_block} - {args.end_block} could not be fetched')
+                    return None
+                else:
+                    print(f"Attempt {attempt} of {MAX_TRIES} failed for the block range {cursor} - {chunk_end}. Retrying in {TIME_DELAY} seconds...")
+                    time.sleep(TIME_DELAY)
+                continue
+
+            attempt = 0
+            traces.extend(result)
+            logger.info(f'fetched {len(result)} traces for the block range {cursor} - {chunk_end} ({elapsed:.2f}s)')
+            cursor = chunk_end + 1
+            if(elapsed < TRACE_FILTER_FAST):
+                chunk = min(chunk + TRACE_FILTER_STEP, TRACE_FILTER_MAX_CHUNK) # additive increase
+
+        if(len(traces) > 0):
+            # merge chunks in block order (stable, keeps the trace order within a block)
+            traces = sorted(traces, key=lambda tr: tr['blockNumber'])
+            logger.info(f'fetched {len(traces)} traces')
+            return traces
         
         logger.info(f'no traces were found for the search range : {args.start_block} - {args.end_block}')
-        logger.error(f'response code : {response.status_code}')
-        return None
+        return [] # (None means that the range could not be fetched completely)
         
     def format_traces(self, traces):
-        collect = pd.DataFrame()
+        # implementations of the called proxy contracts in one batch
+        self.proxies.prefetch([tr['action']['to'] for tr in traces if 'to' in tr.get('action', {}) and tr['action']['to'] is not None])
+        collect = utils.Row_accumulator()
         for tr in traces:
             tx = {}
             # print(tr)
@@ -729,18 +929,20 @@ class Eth_tracker():
             tx['decoded'] = decoded
             tx['abi'] = abi_exists
 
-            tx_df = pd.DataFrame([tx])
-            collect = pd.concat([collect, tx_df])
+            collect.append(tx)
         
-        #reset index
-        collect = collect.reset_index(drop=True)
+        # build the frame once
+        collect = collect.to_frame()
 
         return collect
 
     def public_library_check(self, hex_input):
         # get first 8 hex digits (4 bytes) + 2 (0x)
         hex_signature = hex_input[:10] 
-        text_signature = self.query_public_library(hex_signature)
+        # local signature database first (see signature_db.py), 4byte.directory only for selectors never seen before
+        known, text_signature = self.signatures.lookup(hex_signature)
+        if(not known):
+            text_signature = self.query_public_library(hex_signature)
         if(text_signature is None):
             logger.error(f'input hex : {hex_signature} was not found in the public library. Input cannot be decoded')
             decoded = hex_signature
@@ -817,7 +1019,7 @@ class Eth_tracker():
         search_addr = Web3.to_checksum_address(search_addr) 
         # get traces
         traces = self.send_trace_filter_req(args, search_addr)
-        if(traces is not None):
+        if(traces is not None and len(traces) > 0):
             logger.info(f'fomatting filter traces for the address : {search_addr}')
             # get target blocks
             formatted = self.format_traces(traces)
@@ -826,6 +1028,36 @@ class Eth_tracker():
             # no trace was found.
             return None
 
+    def _get_traces_combined(self, pending, args, engine):
+        """
+        one trace_filter per block window for a whole batch of addresses (fromAddress/toAddress array),
+        the combined result is split back per address. returns formatted traces in the order of `pending`
+        """
+        addr_batches = [pending[ii:ii+COMBINED_ADDR_BATCH] for ii in range(0, len(pending), COMBINED_ADDR_BATCH)]
+        calls = []
+        for addr_batch in addr_batches:
+            logger.info(f'getting traces for {len(addr_batch)} addresses in a single filter at {args.pos} position')
+            checksum_batch = [Web3.to_checksum_address(search_addr) for search_addr in addr_batch]
+            calls.append((self.send_trace_filter_req, (args, checksum_batch)))
+        batch_traces = engine.run(calls)
+
+        results = []
+        for addr_batch, traces in zip(addr_batches, batch_traces):
+            if(traces is None):
+                # the batch range could not be fetched completely : nothing is written (or cached) for these addresses
+                logger.error(f'trace_filter failed for a batch of {len(addr_batch)} addresses, they are not exported and will be fetched again on the next run')
+                results += [None] * len(addr_batch)
+                continue
+            # no traces for the whole batch is a valid (empty) result here
+            demuxed = self.demux_by_address(traces, addr_batch, lambda tr: tr.get('action', {}).get(args.pos))
+            for search_addr in addr_batch:
+                if(len(demuxed[search_addr]) > 0):
+                    logger.info(f'fomatting filter traces for the address : {search_addr}')
+                    results.append(self.format_traces(demuxed[search_addr]))
+                else:
+                    results.append(None)
+        return results
+
     def query_public_library(self, hex_signature):
         url = f"https://www.4byte.directory/api/v1/signatures/?hex_signature={hex_signature}"
         
@@ -834,7 +1066,10 @@ class Eth_tracker():
             data = response.json()
             if 'results' in data and len(data['results']) > 0:
                 logger.info(f'fetched function/event signature for the hex signature : {hex_signature}')
-                return data['results'][0]['text_signature']
+                # keep every colliding signature, ranked by their 4byte id (a selector without any valid result is stored as a miss)
+                if self.signatures.put_signatures([(hex_signature, entry['text_signature'], entry['id']) for entry in data['results']]) > 0:
+                    return self.signatures.lookup(hex_signature)[1]
+            self.signatures.put_miss(hex_signature)
         logger.info(f'no matching text signature for {hex_signature}')
         return None
     
@@ -842,25 +1077,34 @@ class Eth_tracker():
 
 
     def get_traces_from_filter(self, CONTRACTS, args):
+        cache_root = f'./output/{self.DATE}/{args.start_block}_{args.end_block}/traces_{args.pos}'
+        pending = []
         for search_addr in CONTRACTS:
-            logger.info(f'getting traces for the address : {search_addr}, starting block : {args.start_block} ending block : {args.end_block} at {args.pos} position')
             # check if its cached
-            cache_root = f'./output/{self.DATE}/{args.start_block}_{args.end_block}/traces_{args.pos}'
             cache_file = f'{cache_root}/{search_addr}.csv'
-            
             if(os.path.exists(cache_file)):
                 logger.info(f'traces for the address : {search_addr} was already exported for the given block range')
-                
             else:
-                target_traces = self._get_traces_filter(args, search_addr)
-                
-                if(target_traces is not None): # make sure that traces were exported.
-                    logger.info(f'found {len(target_traces)} trace entries for addr : {search_addr}')
-                    utils.check_dir(cache_root)
-                    target_traces.to_csv(cache_file, index=False)
-                    logger.info(f'exporting done.')
-                else:
-                    logger.error(f'no logs were found for the given range of blocks')
+                pending.append(search_addr)
+
+        # keep several trace_filter requests in flight, results come back in the order of the addresses
+        for search_addr in pending:
+            logger.info(f'getting traces for the address : {search_addr}, starting block : {args.start_block} ending block : {args.end_block} at {args.pos} position')
+        engine = async_rpc.Async_RPC(getattr(args, 'max_in_flight', async_rpc.MAX_IN_FLIGHT))
+        if(getattr(args, 'combined', False)):
+            results = self._get_traces_combined(pending, args, engine)
+        else:
+            results = engine.run([(self._get_traces_filter, (args, search_addr)) for search_addr in pending])
+
+        for search_addr, target_traces in zip(pending, results):
+            cache_file = f'{cache_root}/{search_addr}.csv'
+            if(target_traces is not None): # make sure that traces were exported.
+                logger.info(f'found {len(target_traces)} trace entries for addr : {search_addr}')
+                utils.check_dir(cache_root)
+                target_traces.to_csv(cache_file, index=False)
+                logger.info(f'exporting done.')
+            else:
+                logger.error(f'no logs were found for the given range of blocks')
     
     def get_all_traces(self, CONTRACTS, args):
         
@@ -915,6 +1159,66 @@ class Eth_tracker():
             return None
 
 
+### streaming block ranges (traces_range, txs_range, contracts_range)
+    def fetch_range_block(self, job, block):
+        # fetch stage, runs in the read-ahead threads (only touches the given block)
+        if(job == 'traces_range'):
+            return self.fetch_blocktrace(self.apis['RPC_PROVIDER'], block_id=block, cache_write=self.cache_range_blocks)
+        return self.fetch_blockinfo(full_transactions=True, block_id=block, cache_write=self.cache_range_blocks)
+
+    def process_range_block(self, job, data, addr_pos, ETHERSCAN_API=None):
+        # match + write stage for one block, self.block_id has to be set to the block first (used in the written results)
+        if(job == 'traces_range'):
+            actions = self.get_trace_actions(data)
+            if(len(actions)):
+                self.find_interacting_traces(actions, data, ETHERSCAN_API=ETHERSCAN_API, addr_pos=addr_pos)
+        else:
+            txs = self.get_transactions(data)
+            if(len(txs)==0):
+                return
+            if(job == 'txs_range'):
+                self.find_interacting_contracts(txs, ETHERSCAN_API=ETHERSCAN_API, addr_pos=addr_pos)
+            else:
+                self.find_interacting_addrs(txs, addr_pos=addr_pos)
+
+    def run_range(self, job, start_block, end_block, addr_pos, read_ahead=block_stream.READ_AHEAD, ETHERSCAN_API=None, cache_blocks=False):
+        """
+        fetch -> match -> write for every block in [start_block, end_block], blocks are streamed (see block_stream.py) :
+        up to read_ahead blocks are fetched while the current block is matched and written, memory stays bounded by
+        the read-ahead window whatever the size of the range.
+        output files are the same as for the single block jobs (traces_*, txs_*, contracts_*).
+        cached blocks are used, fetched blocks are only added to the block cache with cache_blocks=True.
+        returns the blocks that failed (also saved to ./output/<date>/range/, so they can be run again).
+        """
+        self.cache_range_blocks = cache_blocks
+        blocks = range(int(start_block), int(end_block) + 1)
+        logger.info(f'{job} : streaming {len(blocks)} blocks ({start_block} - {end_block}) with {read_ahead} blocks read ahead')
+        failed = []
+        started = time.time()
+        stream = block_stream.stream_blocks(blocks, lambda block: self.fetch_range_block(job, block), read_ahead)
+        for ii, (block, data) in enumerate(stream):
+            if(data is None or isinstance(data, block_stream.Fetch_error)):
+                failed.append(block)
+                continue
+            self.block_id = block
+            try:
+                self.process_range_block(job, data, addr_pos, ETHERSCAN_API)
+            except Exception as e:
+                logger.error(f'processing block {block} failed : {e}')
+                failed.append(block)
+            if((ii + 1) % RANGE_PROGRESS_EVERY == 0):
+                logger.info(f'{job} : {ii + 1} of {len(blocks)} blocks processed ({(ii + 1) / (time.time() - started):.1f} blocks/s)')
+
+        logger.info(f'{job} : {len(blocks)} blocks processed in {time.time() - started:.1f}s, {len(failed)} failed')
+        if(len(failed)):
+            utils.check_dir(f'./output/{self.DATE}/range')
+            failed_file = f'./output/{self.DATE}/range/{job}_{addr_pos}_{start_block}_{end_block}_failed_blocks.json'
+            with open(failed_file, 'w') as outfile:
+                json.dump(failed, outfile)
+            logger.error(f'blocks that failed were saved to {failed_file}')
+        return failed
+
+
 
 
 #below for debugging purpose
@@ -0,0 +1,79 @@
+import logging
+from eth_utils import keccak, to_checksum_address
+
+try:
+    from eth_abi import decode as abi_decode, encode as abi_encode # eth-abi >= 4
+except ImportError:
+    from eth_abi import decode_abi as abi_decode, encode_abi as abi_encode # eth-abi 2.x/3.x
+
+logger = logging.getLogger(__name__)
+
+
+def abi_type(param):
+    # canonical type string of an abi input, tuples are expanded from their components ('tuple[]' -> '(address,uint256)[]')
+    type_str = param['type']
+    if type_str.startswith('tuple'):
+        return '(' + ','.join(abi_type(component) for component in param['components']) + ')' + type_str[len('tuple'):]
+    return type_str
+
+
+def normalize_value(param, value):
+    # same output as web3's decode_function_input : checksummed addresses, lists for arrays and dicts for tuples
+    type_str = param['type']
+    if type_str.endswith(']'):
+        inner = dict(param, type=type_str[:type_str.rindex('[')])
+        return [normalize_value(inner, item) for item in value]
+    if type_str == 'tuple':
+        return {component['name']: normalize_value(component, item) for component, item in zip(param['components'], value)}
+    if type_str == 'address':
+        return to_checksum_address(value)
+    return value
+
+
+class Decoded_function():
+    """
+    stands in for the web3 contract function returned by decode_function_input (callers only use .function_identifier).
+    """
+    def __init__(self, name, signature, abi):
+        self.function_identifier = name
+        self.fn_name = name
+        self.signature = signature
+        self.abi = abi
+
+    def __repr__(self):
+        return f'<Function {self.signature}>'
+
+
+class Selector_decoder():
+    """
+    calldata decoder built once per ABI : 4-byte selector -> (function, eth_abi types, abi inputs).
+    decoding is a dict lookup plus one eth_abi.decode call, no web3 Contract machinery.
+    """
+    def __init__(self, parsed_abi):
+        self.functions = {}
+        for entry in parsed_abi:
+            if entry.get('type', 'function') != 'function':
+                continue
+            inputs = entry.get('inputs', [])
+            types = [abi_type(param) for param in inputs]
+            signature = f"{entry['name']}({','.join(types)})"
+            selector = '0x' + keccak(text=signature)[:4].hex()
+            self.functions[selector] = (Decoded_function(entry['name'], signature, entry), types, inputs)
+
+    def __len__(self):
+        return len(self.functions)
+
+    def decode(self, hex_input):
+        """
+        returns (function, params) like contract.decode_function_input.
+        raises ValueError if the selector is not part of the ABI.
+        """
+        if isinstance(hex_input, (bytes, bytearray)):
+            hex_input = '0x' + bytes(hex_input).hex()
+        selector = hex_input[:10].lower()
+        if selector not in self.functions:
+            raise ValueError(f'Could not find any function with matching selector {selector}')
+        func, types, inputs = self.functions[selector]
+        values = abi_decode(types, bytes.fromhex(hex_input[10:]))
+        params = {param['name']: normalize_value(param, value) for param, value in zip(inputs, values)}
+        return func, params
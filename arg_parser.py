@@ -1,6 +1,6 @@
 import argparse
 
-def get_args():
+def get_args(argv=None):
     # set/parse cli arguments
     parser = argparse.ArgumentParser(description="eth ETL program")
     subparsers = parser.add_subparsers(dest="job", help="Choose a job to execute.")
@@ -45,6 +45,35 @@ def get_args():
     trt_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id for running multiple jobs")
 
 
+
+    # range jobs : blocks are streamed through fetch -> match -> write with a bounded read-ahead (no block list is computed beforehand)
+    for job, help_str in [("traces_range", "export traces calling (to) / called by (from) the input address for every block of a range"),
+                          ("txs_range", "export transactions sent to (to) / from (from) the input address for every block of a range"),
+                          ("contracts_range", "export addresses interacting with the input address (no input data) for every block of a range")]:
+        range_parser = subparsers.add_parser(job, help=help_str)
+        range_parser.add_argument("--start_block", "-sb", type=str, required=True, help="starting blocknumber")
+        range_parser.add_argument("--end_block", '-eb', type=str, default='latest', help="ending blocknumber (defaults to the current head)")
+        range_parser.add_argument("--addr", "-a", type=str, nargs='+', required=True, help="Contract address of interest")
+        range_parser.add_argument("--pos", "-p", type=str, choices=['from', 'to'], default='to', help="Contract address position")
+        range_parser.add_argument("--read_ahead", "-r", type=int, default=8, help="number of blocks fetched ahead of the block being processed (bounds the memory use)")
+        range_parser.add_argument("--cache_blocks", action="store_true", help="also add the fetched blocks to the local block cache (off by default, the cache would grow with the range)")
+        range_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id for running multiple jobs")
+
+
+    # follow the chain head (incremental, persisted watermark, reorgs retract the outputs of orphaned blocks)
+    follow_parser = subparsers.add_parser("follow", help="process every new block once for a single block job (contracts_*, txs_*, traces_*), handles reorgs")
+    follow_parser.add_argument("--job_name", "-jn", type=str, required=True, choices=['contracts_from', 'contracts_to', 'txs_from', 'txs_to', 'traces_from', 'traces_to'], help="job to run for each new block")
+    follow_parser.add_argument("--addr", "-a", type=str, nargs='+', required=True, help="Contract address of interest")
+    follow_parser.add_argument("--start_block", "-sb", type=str, default=None, help="first block when there is no saved state yet (defaults to the current head)")
+    follow_parser.add_argument("--end_block", "-eb", type=str, default=None, help="stop after this block (default : run until interrupted)")
+    follow_parser.add_argument("--confirmations", "-cf", type=int, default=0, help="only process blocks this many blocks below the head")
+    follow_parser.add_argument("--poll_interval", "-i", type=float, default=4, help="seconds between head polls")
+    follow_parser.add_argument("--read_ahead", "-r", type=int, default=8, help="number of blocks fetched ahead when catching up")
+    follow_parser.add_argument("--cache_blocks", action="store_true", help="also add the fetched (final) blocks to the local block cache")
+    follow_parser.add_argument("--max_attempts", "-m", type=int, default=5, help="attempts per block before a block whose processing keeps failing is recorded as failed and skipped")
+    follow_parser.add_argument("--state_file", "-sf", type=str, default=None, help="watermark file (defaults to ./output/follow/<job_name>_<hash of the addresses>.json)")
+    follow_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id for running multiple jobs")
+
        
     # apply filter (if supported by the rpc provider) to get addrs/transactions/traces 
     filter_parser = subparsers.add_parser("apply_filter", help="apply filter on the range of blocknumbers to query addrs/transactions/traces")
@@ -54,14 +83,17 @@ def get_args():
     filter_parser.add_argument("--addr", "-a", type=str, nargs='+', required=True,help="Contract address of interest")
     filter_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id for running multiple jobs")
     filter_parser.add_argument("--save_blocklist", "-sbl", type=bool, default=True, help="flag for saving interim block list")
+    filter_parser.add_argument("--max_in_flight", "-c", type=int, default=16, help="number of rpc requests kept in flight (concurrency limit)")
     
 
-    # get logs (2k range limit) 
+    # get logs (the range is split into 2k block windows) 
     filter_parser = subparsers.add_parser("get_logs", help="apply filter on the range of blocknumbers to get event logs")
     filter_parser.add_argument("--start_block", "-sb", type=str, required=True, help="starting blocknumber")
     filter_parser.add_argument("--end_block", '-eb', type=str, required=True, help="ending blocknumber")
     filter_parser.add_argument("--addr", "-a", type=str, nargs='+', required=True,help="Contract address of interest")
     filter_parser.add_argument("--topics", "-t", type=str, nargs='+', required=False,help="topics of interest (optional, if not specified, get_logs returns all topics)")
+    filter_parser.add_argument("--max_in_flight", "-c", type=int, default=16, help="number of rpc requests kept in flight (concurrency limit)")
+    filter_parser.add_argument("--combined", "-m", action="store_true", help="query all addresses in a single request per block window and split the result per address")
     filter_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id for running multiple jobs")
     
     # traces by applying filters (2k range limit) 
@@ -70,6 +102,8 @@ def get_args():
     filter_parser.add_argument("--end_block", '-eb', type=str, required=True, help="ending blocknumber")
     filter_parser.add_argument("--addr", "-a", type=str, nargs='+', required=True,help="Contract address of interest")
     filter_parser.add_argument("--pos", "-p", type=str, required=True,help="Contract address position")
+    filter_parser.add_argument("--max_in_flight", "-c", type=int, default=16, help="number of rpc requests kept in flight (concurrency limit)")
+    filter_parser.add_argument("--combined", "-m", action="store_true", help="query all addresses in a single request per block window and split the result per address")
     filter_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id for running multiple jobs")
     
     # export all traces given a blocknumber and a target transaction position 
@@ -112,12 +146,12 @@ def get_args():
     # filter_parser.add_argument("--interval", "-i", type=int, required=False, default = 1, help="interval for fetch prices (in days, defaults to 1 day)")
     # filter_parser.add_argument("--job_id", "-j", type=str, default='0', help="job id when running multiple jobs")
    
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 # fetch the right pipeline for the given job name
 def job_parser(args):
-    etl_jobs = ['contracts_from', 'contracts_to', 'txs_to', 'traces_to', 'txs_from', 'traces_from', 'apply_filter', 'get_logs', 'trace_filter', 'trace_out']
+    etl_jobs = ['contracts_from', 'contracts_to', 'txs_to', 'traces_to', 'txs_from', 'traces_from', 'apply_filter', 'get_logs', 'trace_filter', 'trace_out', 'traces_range', 'txs_range', 'contracts_range', 'follow']
     decode_jobs = ['decode_trace', 'decode_logs']
     price_fetch_jobs = ['price_current', 'price_historical']
 
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+
+# default number of requests kept in flight against the rpc provider
+MAX_IN_FLIGHT = 16
+
+
+class Async_RPC():
+    """
+    asyncio engine that keeps up to max_in_flight blocking rpc calls running at the same time.
+
+    Each call is a (function, args) pair, e.g. (eth.send_request, (url, body)) or (eth._get_logs_window, (args, addr, start, end)).
+    The functions keep their own retry handling (retry_on_not_200, range bisection), so retry semantics do not change.
+    Results are returned in the order of the submitted calls.
+    """
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT):
+        self.max_in_flight = max(int(max_in_flight), 1)
+
+    async def _run_one(self, loop, executor, semaphore, func, args):
+        async with semaphore:
+            return await loop.run_in_executor(executor, lambda: func(*args))
+
+    async def _gather(self, calls):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            tasks = [self._run_one(loop, executor, semaphore, func, args) for func, args in calls]
+            return await asyncio.gather(*tasks)
+
+    def run(self, calls):
+        calls = list(calls)
+        if(len(calls)==0):
+            return []
+        logger.info(f'sending {len(calls)} rpc requests with up to {self.max_in_flight} requests in flight')
+        return asyncio.run(self._gather(calls))
@@ -0,0 +1,46 @@
+import os, sys
+import time
+import shlex
+import statistics
+import subprocess
+import argparse
+
+# cold start of main.py per job type : fresh interpreter, arguments parsed, job modules imported,
+# stopped right before the job runs (ETH_TRACKER_DRY_START=1, nothing is fetched and the node is not contacted)
+JOBS = {
+    'help': '-h',
+    'contracts_from': 'contracts_from -b 17781200 -a 0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D',
+    'traces_to': 'traces_to -b 17781200 -a 0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D',
+    'get_logs': 'get_logs -sb 17781200 -eb 17781300 -a 0x7a250d5630B4cF539739dF2C5dAcb4c659F2488D',
+    'decode_trace': 'decode_trace -s transfer -e ./output/traced_out.csv',
+    'decode_logs': 'decode_logs -e ./output/logs.csv',
+    'price_current': 'price_current -s defillama -t 0x6B175474E89094C44Da98b954EedeAC495271d0F',
+}
+
+
+def time_run(command, dry=True):
+    env = dict(os.environ)
+    if dry:
+        env['ETH_TRACKER_DRY_START'] = '1'
+    start = time.perf_counter()
+    process = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        print(f"  failed ({process.returncode}) : {process.stderr.decode(errors='replace').strip()[-500:]}")
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="cold start time of main.py per job type")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="runs per job (a fresh interpreter each time)")
+    parser.add_argument("--jobs", "-j", type=str, nargs='+', default=list(JOBS), help=f"job types to measure ({', '.join(JOBS)})")
+    parser.add_argument("--line", "-l", type=str, nargs='*', default=[], help="full job lines to time end to end (e.g. a decode job on a file whose abis are cached)")
+    args = parser.parse_args()
+
+    runs = [(job, [sys.executable, 'main.py'] + shlex.split(JOBS[job]), True) for job in args.jobs]
+    runs += [(line, [sys.executable, 'main.py'] + shlex.split(line), False) for line in args.line]
+
+    print(f"{'job':<40} {'min (s)':>8} {'median (s)':>11}")
+    for name, command, dry in runs:
+        times = [time_run(command, dry) for _ in range(args.repeat)]
+        print(f"{name[:40]:<40} {min(times):>8.3f} {statistics.median(times):>11.3f}")
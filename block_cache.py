@@ -0,0 +1,126 @@
+import os
+import json
+import gzip
+import time
+import threading
+import logging
+from collections.abc import Mapping
+import hexbytes
+
+logger = logging.getLogger(__name__)
+
+
+# only blocks at least FINALITY_DEPTH blocks below the head are cached (their content will not change anymore)
+FINALITY_DEPTH = 64
+CACHE_ROOT = './cache/blocks'
+HEAD_TTL = 12 # seconds, how long a fetched head number is trusted before asking the node again
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def _encode(obj):
+    # web3 results (AttributeDict/HexBytes) -> json serializable objects
+    if isinstance(obj, (hexbytes.HexBytes, bytes)):
+        return {'__hexbytes__': hexbytes.HexBytes(obj).hex()}
+    elif isinstance(obj, Mapping):
+        return {key: _encode(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_encode(value) for value in obj]
+    return obj
+
+
+def _decode(obj, attrdict):
+    # inverse of _encode, dicts are restored as `attrdict` (web3's AttributeDict) when the cached object was a web3 result
+    if isinstance(obj, dict):
+        if len(obj) == 1 and '__hexbytes__' in obj:
+            return hexbytes.HexBytes(obj['__hexbytes__'])
+        decoded = {key: _decode(value, attrdict) for key, value in obj.items()}
+        return attrdict(decoded) if attrdict is not None else decoded
+    elif isinstance(obj, list):
+        return [_decode(value, attrdict) for value in obj]
+    return obj
+
+
+class Block_cache():
+    """
+    local, gzip-compressed content store for raw block data (trace_block, eth_getBlockByNumber).
+    entries are keyed by block number and only written for finalized blocks (FINALITY_DEPTH below the head), whose
+    content cannot change anymore. The block hash is stored with each entry for reference, it is not checked on read.
+    """
+    def __init__(self, w3, cache_root=CACHE_ROOT, finality_depth=FINALITY_DEPTH):
+        self.w3 = w3
+        self.cache_root = cache_root
+        self.finality_depth = int(finality_depth)
+        self._head = None
+        self._head_time = 0
+
+    def get_head(self):
+        if self._head is None or time.time() - self._head_time > HEAD_TTL:
+            self._head = self.w3.eth.block_number
+            self._head_time = time.time()
+        return self._head
+
+    def is_final(self, block_id):
+        if not isinstance(block_id, int):
+            return False # 'latest', 'pending', ...
+        # cheap check against the last known head first, only ask the node again if the block could be too recent
+        if self._head is not None and block_id <= self._head - self.finality_depth:
+            return True
+        return block_id <= self.get_head() - self.finality_depth
+
+    def path(self, kind, block_number):
+        return f'{self.cache_root}/{kind}/{block_number // 10000}/{block_number}.json.gz'
+
+    def get(self, kind, block_number):
+        cached_file = self.path(kind, block_number)
+        if not os.path.exists(cached_file):
+            return None
+        try:
+            with gzip.open(cached_file, 'rt') as infile:
+                entry = json.load(infile)
+        except Exception as e:
+            logger.error(f'cached {kind} for block {block_number} could not be read : {e}')
+            return None
+        # web3 is only imported here (and in put), when block data is actually used
+        from web3.datastructures import AttributeDict
+        return _decode(entry['data'], AttributeDict if entry['attrdict'] else None)
+
+    def put(self, kind, block_number, block_hash, data):
+        from web3.datastructures import AttributeDict
+        cached_file = self.path(kind, block_number)
+        os.makedirs(os.path.dirname(cached_file), exist_ok=True)
+        entry = {'number': block_number, 'hash': block_hash, 'attrdict': isinstance(data, AttributeDict), 'data': _encode(data)}
+        # write to a temporary file first so that concurrent processes never read half-written entries
+        tmp_file = f'{cached_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with gzip.open(tmp_file, 'wt') as outfile:
+            json.dump(entry, outfile)
+        os.replace(tmp_file, cached_file)
+
+    def read_through(self, kind, block_id, fetch, get_hash, write=True):
+        """
+        returns the cached entry for finalized blocks, otherwise calls fetch() and caches the result if the block is final.
+        get_hash(data) extracts the block hash from the fetched data (None if unknown).
+        with write=False fetched blocks are not added to the cache (long range sweeps would grow it without bound).
+        """
+        final = self.is_final(block_id)
+        if final:
+            data = self.get(kind, block_id)
+            if data is not None:
+                logger.info(f'using cached {kind} for block {block_id}')
+                return data
+        data = fetch()
+        if write and final and data is not None:
+            self.put(kind, block_id, get_hash(data), data)
+        return data
+
+
+def get_block_cache(w3, cache_root=None, finality_depth=None):
+    # one cache object per process and cache location (settings can be given in .env)
+    cache_root = cache_root or os.getenv('BLOCK_CACHE_DIR') or CACHE_ROOT
+    finality_depth = finality_depth or os.getenv('BLOCK_CACHE_FINALITY') or FINALITY_DEPTH
+    key = (id(w3), cache_root, int(finality_depth))
+    with _CACHES_LOCK:
+        if key not in _CACHES:
+            _CACHES[key] = Block_cache(w3, cache_root, finality_depth)
+        return _CACHES[key]
@@ -0,0 +1,165 @@
+import os
+import threading
+import logging
+import numpy as np
+import http_session
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILE = './cache/block_index.npz'
+BATCH_SIZE = 100 # headers per JSON-RPC batch
+PROBE_WIDTH = 8 # headers fetched on each side of an interpolated guess
+SPACING = 10000 # block spacing used by build()
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+class Block_time_index():
+    """
+    persisted, incrementally extended sparse table of (block number, timestamp).
+
+    lookups bracket the requested time in the table and answer locally when the bracket is tight.
+    otherwise the block is located by interpolation search, the headers around the guess are fetched in
+    one JSON-RPC batch and added to the table, so later lookups around the same time are answered from local data.
+    a guess that does not at least halve the bracket is followed by a bisection step, so a lookup never needs more
+    batches than a binary search.
+    """
+    def __init__(self, w3, index_file=INDEX_FILE):
+        self.w3 = w3
+        self.index_file = index_file
+        self.blocks = np.zeros(0, dtype=np.int64)
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.lock = threading.Lock()
+        self.load()
+
+    @property
+    def rpc_provider(self):
+        # read on use, lookups answered from the table do not touch a lazily connected web3 (utils.Lazy_web3)
+        return getattr(self.w3.provider, 'endpoint_uri', None)
+
+    def load(self):
+        if os.path.exists(self.index_file):
+            try:
+                with np.load(self.index_file) as data:
+                    self._insert(data['blocks'], data['timestamps'])
+                logger.info(f'loaded block timestamp index with {len(self.blocks)} entries')
+            except Exception as e:
+                logger.error(f'block timestamp index {self.index_file} could not be read : {e}')
+
+    def save(self):
+        # merge with entries saved by other processes in the meantime, then replace the file atomically
+        if os.path.exists(self.index_file):
+            try:
+                with np.load(self.index_file) as data:
+                    self._insert(data['blocks'], data['timestamps'])
+            except Exception:
+                pass
+        os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+        tmp_file = f'{self.index_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'wb') as outfile:
+            np.savez(outfile, blocks=self.blocks, timestamps=self.timestamps)
+        os.replace(tmp_file, self.index_file)
+
+    def _insert(self, blocks, timestamps):
+        blocks = np.concatenate([self.blocks, np.asarray(blocks, dtype=np.int64)])
+        timestamps = np.concatenate([self.timestamps, np.asarray(timestamps, dtype=np.int64)])
+        self.blocks, unique_pos = np.unique(blocks, return_index=True)
+        self.timestamps = timestamps[unique_pos]
+
+    def fetch_timestamps(self, block_numbers):
+        # fetch headers in JSON-RPC batches and add them to the table
+        block_numbers = [int(bn) for bn in block_numbers]
+        fetched_blocks, fetched_ts = [], []
+        for ii in range(0, len(block_numbers), BATCH_SIZE):
+            batch = block_numbers[ii:ii+BATCH_SIZE]
+            if self.rpc_provider is not None:
+                headers = http_session.post_batch(self.rpc_provider, [("eth_getBlockByNumber", [hex(bn), False]) for bn in batch])
+                timestamps = [None if header is None else int(header['timestamp'], 16) for header in headers]
+            else:
+                timestamps = [self.w3.eth.get_block(bn).timestamp for bn in batch]
+            for bn, ts in zip(batch, timestamps):
+                if ts is not None:
+                    fetched_blocks.append(bn)
+                    fetched_ts.append(ts)
+        self._insert(fetched_blocks, fetched_ts)
+        return dict(zip(fetched_blocks, fetched_ts))
+
+    def extend_to_head(self):
+        # block 1 is the lower interpolation anchor, the genesis timestamp (0 on mainnet) would skew every guess
+        head = self.w3.eth.get_block_number()
+        missing = [bn for bn in [0, 1, head] if bn <= head and not self._has(bn)]
+        if len(missing):
+            self.fetch_timestamps(missing)
+        return head
+
+    def build(self, spacing=SPACING):
+        # optional prefill of the sparse table (every `spacing` blocks up to the head)
+        with self.lock:
+            head = self.extend_to_head()
+            missing = [bn for bn in range(0, head, spacing) if not self._has(bn)]
+            logger.info(f'filling the block timestamp index with {len(missing)} headers')
+            self.fetch_timestamps(missing)
+            self.save()
+
+    def _has(self, block_number):
+        pos = np.searchsorted(self.blocks, block_number)
+        return pos < len(self.blocks) and self.blocks[pos] == block_number
+
+    def timestamp_of(self, block_number):
+        with self.lock:
+            pos = np.searchsorted(self.blocks, block_number)
+            if pos < len(self.blocks) and self.blocks[pos] == block_number:
+                return int(self.timestamps[pos])
+            ts = self.fetch_timestamps([block_number]).get(int(block_number))
+            if ts is None:
+                raise ValueError(f'timestamp of the block {block_number} could not be fetched')
+            self.save()
+            return ts
+
+    def unixtime_to_blocknum(self, unix_time):
+        # returns the block with the given timestamp or the closest preceding block (-1 before genesis)
+        unix_time = int(unix_time)
+        with self.lock:
+            size = len(self.blocks)
+            if len(self.blocks) == 0 or unix_time >= self.timestamps[-1]:
+                self.extend_to_head()
+            width = None
+            while True:
+                pos = int(np.searchsorted(self.timestamps, unix_time, side='right')) # first entry later than unix_time
+                if pos == 0:
+                    block = -1
+                    break
+                low, low_ts = int(self.blocks[pos-1]), int(self.timestamps[pos-1])
+                if low_ts == unix_time or pos == len(self.blocks):
+                    block = low
+                    break
+                high, high_ts = int(self.blocks[pos]), int(self.timestamps[pos])
+                if high - low == 1:
+                    block = low
+                    break
+                # interpolation search inside the bracket (low_ts <= unix_time < high_ts),
+                # bisection when the previous probe did not at least halve the bracket
+                if high - low - 1 <= BATCH_SIZE:
+                    probes = range(low + 1, high)
+                else:
+                    if width is not None and high - low > width // 2:
+                        guess = (low + high) // 2
+                    else:
+                        guess = low + int((unix_time - low_ts) * (high - low) / (high_ts - low_ts))
+                    probes = range(max(guess - PROBE_WIDTH, low + 1), min(guess + PROBE_WIDTH + 1, high))
+                width = high - low
+                if len(self.fetch_timestamps(probes)) == 0:
+                    raise ValueError(f'headers between the blocks {low} and {high} could not be fetched')
+            if len(self.blocks) > size: # only rewrite the file when headers were added
+                self.save()
+        return block
+
+
+def get_block_index(w3, index_file=INDEX_FILE):
+    # one index per process, shared by utils.time_handler, Price_generic and Transfer_Decoder
+    with _INDEXES_LOCK:
+        if index_file not in _INDEXES:
+            _INDEXES[index_file] = Block_time_index(w3, index_file)
+        return _INDEXES[index_file]
@@ -0,0 +1,54 @@
+import logging
+import itertools
+import collections
+import concurrent.futures
+
+logger = logging.getLogger(__name__)
+
+
+# default number of blocks fetched ahead of the block that is being processed
+READ_AHEAD = 8
+
+
+class Fetch_error():
+    """
+    yielded in place of the data of a block whose fetch raised, so one bad block does not end a long sweep.
+    """
+    def __init__(self, error):
+        self.error = error
+
+    def __repr__(self):
+        return f'<Fetch_error {self.error!r}>'
+
+
+def stream_blocks(blocks, fetch, read_ahead=READ_AHEAD):
+    """
+    generator over (block number, fetch(block number)) in the order of `blocks`.
+
+    `blocks` can be any iterable (a range, or an endless iterator of new heads), it is consumed lazily.
+    up to `read_ahead` fetches run in a thread pool while the caller processes the current block. A new fetch is only
+    submitted when the caller takes the next block (back-pressure), so at most read_ahead + 1 fetched blocks are held
+    in memory, whatever the length of the range.
+    a fetch that raises yields a Fetch_error instead of the data.
+    """
+    read_ahead = max(int(read_ahead), 1)
+    blocks = iter(blocks)
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=read_ahead) as pool:
+        try:
+            for block in itertools.islice(blocks, read_ahead):
+                pending.append((block, pool.submit(fetch, block)))
+            while pending:
+                block, future = pending.popleft()
+                try:
+                    data = future.result()
+                except Exception as e:
+                    logger.error(f'fetching block {block} failed : {e}')
+                    data = Fetch_error(e)
+                for next_block in itertools.islice(blocks, 1):
+                    pending.append((next_block, pool.submit(fetch, next_block)))
+                yield block, data
+        finally:
+            # the caller stopped early (break, exception) : drop the fetches that did not start yet
+            for block, future in pending:
+                future.cancel()
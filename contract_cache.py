@@ -0,0 +1,102 @@
+import json
+import threading
+import logging
+from eth_utils import to_checksum_address
+import utils
+import abi_decoder
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_SIZE = 4096 # contracts kept in memory (least recently used are evicted first)
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+class Contract_entry():
+    """
+    everything decode_input needs for one contract : the parsed ABI, the proxy verdict,
+    the resolved implementation (address and ABI), the web3 Contract object and the selector decoder
+    built from the same ABI (see abi_decoder.py).
+    the Contract object is only built when it is asked for (decoding goes through the selector decoder), so cached
+    decoding does not need a web3 connection.
+    """
+    def __init__(self, contract_addr, parsed_abi, is_proxy, impl_addr=None, impl_abi=None, w3=None, contract_abi=None, unknown_proxy=False, decoder=None):
+        self.contract_addr = contract_addr
+        self.parsed_abi = parsed_abi
+        self.is_proxy = is_proxy
+        self.impl_addr = impl_addr
+        self.impl_abi = impl_abi
+        self.w3 = w3
+        self.contract_abi = contract_abi # parsed abi of the Contract object (implementation abi for resolved proxies)
+        self._contract = None
+        self.unknown_proxy = unknown_proxy
+        self.decoder = decoder
+        self.abi_hash = None # hash of the abi string the entry was built from (set by get_contract_entry)
+
+    @property
+    def contract(self):
+        if self._contract is None and self.w3 is not None and self.contract_abi is not None:
+            self._contract = self.w3.eth.contract(address=self.contract_addr, abi=self.contract_abi)
+        return self._contract
+
+
+def is_proxy_abi(contract_abi):
+    # heuristic used throughout eth-tracker : the abi mentions both 'implementation' and 'upgrade'
+    lowered = contract_abi.lower()
+    return ('implementation' in lowered) and ('upgrade' in lowered)
+
+
+def get_contract_cache():
+    # one cache per process, shared by Eth_tracker and Transfer_Decoder
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = utils.LRU_cache(CACHE_SIZE)
+    return _CACHE
+
+
+def get_contract_entry(tracker, contract_addr, contract_abi):
+    """
+    returns the cached Contract_entry of contract_addr (keyed by the checksummed address), building it on the first call.
+    the entry is rebuilt when the abi differs from the one it was built from.
+    `tracker` is an Eth_tracker or Transfer_Decoder instance (w3, apis, get_proxy_mapping, get_contract_abi are used).
+    """
+    if contract_abi is None:
+        raise ValueError(f'no ABI available for {contract_addr}')
+    cache = get_contract_cache()
+    key = to_checksum_address(contract_addr)
+    abi_hash = hash(contract_abi) # str hashes are cached on the object, no rehash of the abi on repeated calls
+    entry = cache.get(key)
+    if entry is None or entry.abi_hash != abi_hash:
+        entry = build_contract_entry(tracker, contract_addr, contract_abi)
+        entry.abi_hash = abi_hash
+        cache.put(key, entry)
+    return entry
+
+
+def build_contract_entry(tracker, contract_addr, contract_abi):
+    parsed_abi = json.loads(contract_abi)
+
+    # check if it is a proxy contract
+    if not is_proxy_abi(contract_abi):
+        return Contract_entry(contract_addr, parsed_abi, False, w3=tracker.w3, contract_abi=parsed_abi, decoder=abi_decoder.Selector_decoder(parsed_abi))
+
+    logger.info(f'found a proxy contract ({contract_addr}). Fetching the implementation function to get the matching contract')
+    # check first if there is cached data ("get_storage_at" can be expensive in terms of compute unit)
+    impl_addr = tracker.get_proxy_mapping(contract_addr, ETHERSCAN_API=tracker.apis['ETHERSCAN_API'])
+    if impl_addr is None or impl_addr == '' or impl_addr == ZERO_ADDRESS:
+        # proxy type is not handled, callers fall back to the hex signature
+        return Contract_entry(contract_addr, parsed_abi, True, impl_addr=impl_addr, w3=tracker.w3, contract_abi=parsed_abi, unknown_proxy=True)
+
+    impl_addr = to_checksum_address(impl_addr)
+    impl_abi, verdict = tracker.get_contract_abi(impl_addr, ETHERSCAN_API=tracker.apis['ETHERSCAN_API'])
+    parsed_impl_abi = None
+    decoder = None
+    if impl_abi is not None:
+        parsed_impl_abi = json.loads(impl_abi)
+        decoder = abi_decoder.Selector_decoder(parsed_impl_abi)
+    return Contract_entry(contract_addr, parsed_abi, True, impl_addr=impl_addr, impl_abi=impl_abi, w3=tracker.w3, contract_abi=parsed_impl_abi, decoder=decoder)
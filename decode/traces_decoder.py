@@ -1,6 +1,6 @@
 import os,sys
 from dotenv import load_dotenv
-from web3 import Web3 
+from eth_utils import to_checksum_address # (web3 itself is only loaded once the node is used)
 import numpy as np
 import pandas as pd
 import json
@@ -13,7 +13,16 @@ import logging
 import hexbytes
 from functools import wraps
 import time
-import ast
+import http_session
+import block_index
+import metadata_store
+import contract_cache
+import signature_db
+import event_index
+import multicall
+import abi_decoder
+import proxy_resolver
+import etherscan_broker
 
 logger = logging.getLogger(__name__)
         
@@ -54,12 +63,13 @@ def retry_on_not_200(max_retries=10, delay=2):
 
 MAX_TRIES = 10
 TIME_DELAY = 2 # seconds
+LOG_CHUNK_ROWS = 200000 # rows of an exported log file decoded at once
+TOPIC_PATTERN = r'0x[0-9a-fA-F]{64}'
 
 
 # now = datetime.datetime.now()
 # # Format the date to 'day-month-year'
 # DATE = now.strftime('%d%m%y')
-RETRY_UNVERIFIED=False
 
 # function parameter patterns
 
@@ -78,6 +88,36 @@ TRANSFER_FUNC_SIGS = ['transfer',
                       '0x23b872dd', #transferFrom
                       '0xa9059cbb' #transfer
                       ]
+TRANSFER_SELECTOR = '0xa9059cbb' # transfer(address,uint256)
+TRANSFER_FROM_SELECTOR = '0x23b872dd' # transferFrom(address,address,uint256)
+SYMBOL_SELECTOR = '0x95d89b41' # symbol()
+DECIMALS_SELECTOR = '0x313ce567' # decimals()
+MAX_DECIMALS = 255 # decimals() is a uint8 in EIP-20, larger values are garbage (and do not fit into the sqlite INTEGER column)
+
+
+def parse_symbol_decimal(contract_address, symbol_ret, decimal_ret):
+    # symbol() is usually a string, some tokens (MKR, ...) return bytes32. Failing calls are labeled as faulty tokens (same as get_symbol_decimal_erc20)
+    try:
+        symbol_ok, symbol_data = symbol_ret
+        decimal_ok, decimal_data = decimal_ret
+        if(not(symbol_ok and decimal_ok) or len(symbol_data)==0 or len(decimal_data)==0):
+            raise ValueError('symbol() or decimals() call reverted')
+        try:
+            symbol = abi_decoder.abi_decode(['string'], symbol_data)[0]
+        except Exception:
+            if(len(symbol_data)!=32):
+                raise
+            symbol = symbol_data.rstrip(b'\x00').decode('utf-8')
+        decimal = abi_decoder.abi_decode(['uint256'], decimal_data)[0]
+        if(decimal > MAX_DECIMALS):
+            raise ValueError(f'decimals() returned {decimal}')
+        call_results = {'symbol': symbol, 'decimal': decimal}
+    except Exception as e:
+        print(e)
+        logger.error(f'suspecting a faulty erc20 contract : {contract_address} (no symbol or decimal function implemented)')
+        logger.error('labeling as faulty token with decimal point of 18')
+        call_results = {'symbol': 'Faulty', 'decimal': 18}
+    return call_results
 
 
 ### util methods. handles time conversions and simple path handling.
@@ -88,10 +128,16 @@ class Transfer_Decoder():
         self.apis= API
         self.ET_root = eth_tracker_loc
         self.DATE = DATE
+        # abis, bytecode flags, proxy mappings, verified source and token metadata (see metadata_store.py)
+        self.store = metadata_store.get_store(eth_tracker_loc)
+        self.signatures = signature_db.get_signature_db(eth_tracker_loc)
+        self.events = event_index.get_event_index(self.store)
+        self.proxies = proxy_resolver.get_proxy_resolver(w3, self.store)
+        self.etherscan = etherscan_broker.get_broker()
     
     @retry_on_not_200(max_retries=MAX_TRIES, delay=TIME_DELAY)
     def get_url(self, url):
-        response = requests.get(url,timeout=None)
+        response = http_session.get(url,timeout=None)
         return response
 
 
@@ -100,26 +146,12 @@ class Transfer_Decoder():
             os.makedirs(path)
 
     def unixtime_to_blocknum(self, unix_time):
-        # binary search
-        low, high = 0, self.w3.eth.get_block_number()
-
-        while low <= high:
-            mid = int((low + high) / 2)
-            mid_block_timestamp = self.w3.eth.get_block(mid).timestamp
-
-            if mid_block_timestamp == unix_time:
-                return mid
-            elif mid_block_timestamp < unix_time:
-                low = mid + 1
-            else:
-                high = mid - 1
-
-        return high  # Return the closest preceding block number
+        # shared block timestamp index (interpolation search over a persisted sparse table, see block_index.py)
+        return block_index.get_block_index(self.w3).unixtime_to_blocknum(unix_time)  # the closest preceding block number if there is no exact match
 
 
     def blocknum_to_unixtime(self, blocknum):
-        block = self.w3.eth.get_block(blocknum)
-        return block.timestamp
+        return block_index.get_block_index(self.w3).timestamp_of(blocknum)
 
 
     def unixtime_to_datetime(self, unix_timestamp):
@@ -169,101 +201,147 @@ class Transfer_Decoder():
         # first get unique transaction positions logged in this csv. 
 
         tx_positions = pd.unique(csv_df['transactionPosition'])
-        
-        # this concat df includes multiple tx positions in a chronological order.
-        concat = pd.DataFrame() 
-        for tx_pos in tx_positions:
-            logger.info(f'decoding csv file : {csv_file}, transaction position : {tx_pos}')
-            tx_df = csv_df[csv_df['transactionPosition']==tx_pos]
-
-            # get the first trace 
-            init_row = tx_df[tx_df['traceAddress']=='[]']
-
-            # initiating address
-            
-            init_addr = init_row['from'].squeeze()
-            init_contract = init_row['to'].squeeze()
-
-            # sort traces in a chronological order if necessary, *already sorted in a chronological order (miner set sequence) atm.
-            target_concat = pd.DataFrame()
-            if('transfer' in search_str):
-                for search_sig in TRANSFER_FUNC_SIGS:
-                    targets = tx_df[tx_df['decoded'].str.contains(search_sig)]
-                    target_concat=pd.concat([target_concat, targets])
-            
-            # re-assign it for the downstream 
-            targets = target_concat
-
-            # rest = self.sort_trace_rows(rest) 
-
-            # decode each row
-            
-            for ii, row in targets.iterrows():
-                decoded = {}
-                decoded['init_address'] = init_addr
-                decoded['init_contract'] = init_contract
-                decoded['blockNumber'] = row['blockNumber']
-                decoded['tx_pos'] = row['transactionPosition']
-                decoded['callType'] = row['callType']
-
-                # some contracts are considered irregular already from the glance of etherscan.
-                if(row['to'].lower() in IRREGULAR_CONTRACTS):
-                    row_decoded = 'irregular_contract'
-                else:
-                    row_decoded, params = self.trace_decoding_handler(row, use_known_pattern = use_known_pattern)
-                if(row_decoded is not None):
-                    if(row_decoded == 'irregular_contract'):
-                        # save this contract for later inspection
-                        txt_name = f'{parent_dir}/irregular_contracts.txt'
-                        irregular= row['to']
-                        with open(txt_name, "a") as f:
-                            f.write(irregular + "\n") 
-                        logger.info(f'saved(appended) the address of the irregular contract ({irregular}) to {txt_name}')
-                    else:
-                        row_decoded['params'] = str(params)
-                        for k, v in row_decoded.items():
-                            decoded[k] = v
+        tx_rank = pd.Series(np.arange(len(tx_positions)), index=tx_positions)
+
+        # initiating address and contract of each transaction (the first trace)
+        init_rows = csv_df[csv_df['traceAddress']=='[]'].drop_duplicates('transactionPosition')
+        init_addrs = init_rows.set_index('transactionPosition')['from']
+        init_contracts = init_rows.set_index('transactionPosition')['to']
+
+        # sort traces in a chronological order if necessary, *already sorted in a chronological order (miner set sequence) atm.
+        # targets of each transaction, in the order of the search signatures
+        target_concat = []
+        if('transfer' in search_str):
+            for sig_rank, search_sig in enumerate(TRANSFER_FUNC_SIGS):
+                targets = csv_df[csv_df['decoded'].astype(str).str.contains(search_sig)]
+                target_concat.append(targets.assign(_tx_rank=tx_rank[targets['transactionPosition']].to_numpy(), _sig_rank=sig_rank))
+        if(len(target_concat)==0):
+            return pd.DataFrame()
+        targets = pd.concat(target_concat).sort_values(['_tx_rank', '_sig_rank'], kind='stable').reset_index(drop=True)
+        logger.info(f'decoding csv file : {csv_file}, {len(targets)} target traces in {len(tx_positions)} transactions')
+
+        # implementations of the called proxy contracts in one batch
+        self.proxies.prefetch(targets['to'].dropna(), etherscan_source=lambda contract_addr: self.get_etherscan_source_code(contract_addr, self.apis['ETHERSCAN_API']))
+        # symbol/decimals of all called tokens in a few aggregated calls
+        self.prefetch_erc20_denoms(targets.loc[targets['input'].astype(str).str.len()>2, 'to'])
+
+        # standard transfer/transferFrom calldata is decoded by slicing (no ABI needed), the rest goes through the ABI path
+        fast_rows = self.fast_transfer_rows(targets, use_known_pattern)
+
+        decoded_rows = []
+        for ii, row in targets.iterrows():
+            decoded = {}
+            decoded['init_address'] = init_addrs.get(row['transactionPosition'])
+            decoded['init_contract'] = init_contracts.get(row['transactionPosition'])
+            decoded['blockNumber'] = row['blockNumber']
+            decoded['tx_pos'] = row['transactionPosition']
+            decoded['callType'] = row['callType']
+
+            if(ii in fast_rows):
+                function, params = fast_rows[ii]
+                row_decoded = self.decode_input_from_signature(function, params, row, use_known_pattern)
+                if(isinstance(row_decoded, dict)):
+                    row_decoded['params'] = str(params)
+            # some contracts are considered irregular already from the glance of etherscan.
+            elif(row['to'].lower() in IRREGULAR_CONTRACTS):
+                row_decoded = 'irregular_contract'
+            else:
+                row_decoded, params = self.trace_decoding_handler(row, use_known_pattern = use_known_pattern)
+                if(isinstance(row_decoded, dict)):
+                    row_decoded['params'] = str(params)
+            if(row_decoded is not None):
+                if(row_decoded == 'irregular_contract'):
+                    # save this contract for later inspection
+                    txt_name = f'{parent_dir}/irregular_contracts.txt'
+                    irregular= row['to']
+                    with open(txt_name, "a") as f:
+                        f.write(irregular + "\n") 
+                    logger.info(f'saved(appended) the address of the irregular contract ({irregular}) to {txt_name}')
                 else:
-                    logger.error(f'continuing to the next trace as decoding was unsuccessful')
-                    continue
+                    for k, v in row_decoded.items():
+                        decoded[k] = v
+            else:
+                logger.error(f'continuing to the next trace as decoding was unsuccessful')
+                continue
 
-                decode_df = pd.DataFrame(decoded, index=[0])
-                concat = pd.concat([concat, decode_df])
-        
+            decoded_rows.append(decoded)
         
-        concat = concat.reset_index(drop='index')
+        concat = pd.DataFrame(decoded_rows)
+        if(len(concat)==0):
+            return concat
         # remove duplicate traces from proxy calls
         concat = concat[concat['decimal']!=0]
         # if function name and params are same then we drop the one
 
         return concat
-    
+
+    def fast_transfer_rows(self, targets, use_known_pattern=True):
+        """
+        decodes standard erc20/erc721 transfer(address,uint256) and transferFrom(address,address,uint256) calldata by
+        fixed-offset slicing over the whole input column instead of one eth_abi call per trace.
+        only rows the ABI path would decode are taken : the target has to be a contract whose (implementation) ABI
+        contains the selector, and the param names are the ones of that ABI. Irregular contracts, short or
+        non-standard (dirty address padding) inputs and everything else are left to the ABI path.
+        returns {row index: (function name, params)}, the same pair decode_input returns for the row.
+        """
+        inputs = targets['input'].fillna('').astype(str).str.lower()
+        selectors = inputs.str[:10]
+        is_transfer = (selectors==TRANSFER_SELECTOR) & (inputs.str.len()>=10+64*2)
+        is_transfer_from = (selectors==TRANSFER_FROM_SELECTOR) & (inputs.str.len()>=10+64*3)
+        # address words must be left padded with zeros
+        is_transfer &= inputs.str[10:34].str.fullmatch('0{24}')
+        is_transfer_from &= inputs.str[10:34].str.fullmatch('0{24}') & inputs.str[74:98].str.fullmatch('0{24}')
+        fast = (is_transfer | is_transfer_from) & ~targets['to'].astype(str).str.lower().isin(IRREGULAR_CONTRACTS)
+        if(not(fast.any())):
+            return {}
+
+        # selector -> (function, types, abi inputs) of each target's decoder, same verdict/abi/proxy handling as trace_decoding_handler
+        functions = {}
+        for addr in pd.unique(targets.loc[fast, 'to']):
+            functions[addr] = {}
+            token_addr = to_checksum_address(addr)
+            contract_abi, verdict = self.get_contract_abi(token_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
+            if(verdict!='contract' or contract_abi is None):
+                continue
+            try:
+                entry = contract_cache.get_contract_entry(self, token_addr, contract_abi)
+            except Exception as e:
+                logger.error(f'could not prepare the ABI of {token_addr} : {e}')
+                continue
+            if(not(entry.unknown_proxy) and entry.decoder is not None):
+                functions[addr] = entry.decoder.functions
+        fast &= pd.Series([selector in functions.get(addr, {}) for addr, selector in zip(targets['to'], selectors)], index=targets.index)
+        fast_df = targets[fast]
+        fast_inputs = inputs[fast]
+        transfer_from = is_transfer_from[fast].to_numpy()
+        # transfer : to, value / transferFrom : from, to, value
+        arg0 = ('0x' + fast_inputs.str[34:74]).to_numpy()
+        arg1 = ('0x' + fast_inputs.str[98:138]).to_numpy()
+        values = np.where(transfer_from, fast_inputs.str[138:202], fast_inputs.str[74:138])
+
+        checksummed = {}
+        def checksum(addr):
+            if addr not in checksummed:
+                checksummed[addr] = to_checksum_address(addr)
+            return checksummed[addr]
+
+        rows = {}
+        for ii, token_addr, selector, is_from, a0, a1, value in zip(fast_df.index, fast_df['to'], selectors[fast], transfer_from, arg0, arg1, values):
+            func, types, abi_inputs = functions[token_addr][selector]
+            args = [checksum(a0), checksum(a1), int(value, 16)] if is_from else [checksum(a0), int(value, 16)]
+            rows[ii] = (func.function_identifier, {param['name']: arg for param, arg in zip(abi_inputs, args)})
+        logger.info(f'decoded {len(rows)} standard transfer traces by slicing the calldata')
+        return rows
+
     # need to sure that abi is there
     def prep_contract(self, contract_addr):
-        contract_addr = Web3.to_checksum_address(contract_addr)
+        contract_addr = to_checksum_address(contract_addr)
         
         contract_abi, verdict = self.get_contract_abi(contract_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
-        # check if it is a proxy contract 
-        impl_check = 'implementation' in contract_abi.lower()
-        upgrade_check = 'upgrade' in contract_abi.lower()
-        verdict = impl_check and upgrade_check
-        if(verdict):
-            # for openzeppelin upgradable template
-            # padded = Web3.toHex(self.w3.eth.get_storage_at(contract_addr, "0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3"))
-            # padded = padded[-42:]
-            # impl_addr = '0x' + padded[2:]
-            with open(f"./proxy_mapping/{contract_addr}.txt", 'r') as infile:
-                impl_addr = json.load(infile)
-            
-            impl_addr = Web3.to_checksum_address(impl_addr)
-            contract_abi, verdict = self.get_contract_abi(impl_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
-            contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi)
-            return contract
-   
-        # just return the usual contract variable if the contract is not a proxy contract        
-        contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi)
-
-        return contract
+        # proxies are resolved to their implementation abi (memoized per contract, see contract_cache.py)
+        entry = contract_cache.get_contract_entry(self, contract_addr, contract_abi)
+
+        return entry.contract
     
     # not needed for now.
     def sort_trace_rows(self, rest:pd.DataFrame):
@@ -308,7 +386,7 @@ class Transfer_Decoder():
         trace_value = one_trace['value']
         
         
-        contract_addr = Web3.to_checksum_address(contract_addr) 
+        contract_addr = to_checksum_address(contract_addr) 
 
 
         # first check if ABI exists on Etherscan
@@ -372,114 +450,24 @@ class Transfer_Decoder():
         return  decoded_params, params
     
     def get_proxy_mapping(self, addr:str, ETHERSCAN_API=None):
-            
-        # make/check local cache 
-        cached_file = f"./proxy_mapping/{addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                impl_addr = json.load(infile)
-                if(impl_addr == '0x0000000000000000000000000000000000000000'):
-                    if not(os.path.exists(f"./verified_source/{addr}.txt")):
-                        logger.info(f"cached file was found but checking verified source code from etherscan as there was no previous attempt.")
-                        res = self.get_etherscan_source_code(addr,ETHERSCAN_API)
-                        impl_addr = res[0]['Implementation']
-                        logger.info(f'saving proxy mapping for {addr}')
-                        self.check_dir(f"./proxy_mapping")
-                        with open(cached_file, 'w') as outfile:
-                            json.dump(impl_addr, outfile)
-                else:
-                    logger.info(f"using cached bytecode (implementation contract) {impl_addr}")
-                
-        else:
-            # check etherscan for implementation address
-            res = self.get_etherscan_source_code(addr,ETHERSCAN_API)
-            impl_addr = res[0]['Implementation']
-
-            if(len(impl_addr)==42):
-                logger.info(f"found a valid impl addresss from etherscan verified source codes")
-
-            else:
-                # for openzeppelin upgradable template
-                padded = Web3.toHex(self.w3.eth.get_storage_at(addr, "0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3"))
-                padded = padded[-42:]
-                impl_addr = '0x' + padded[2:]
-
-                if(impl_addr!='0x0000000000000000000000000000000000000000'):
-                    logger.info(f"found a valid impl addresss from openzeppelin upgradable template")
-                else:
-                    # check for erc-1967 case
-                    padded = Web3.toHex(self.w3.eth.get_storage_at(addr, "0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc"))
-                    padded = padded[-42:]
-                    impl_addr = '0x' + padded[2:]
-                    
-                    if(impl_addr!='0x0000000000000000000000000000000000000000'):
-                        logger.info(f"found a valid impl addresss through erc-1967 slot check")
-                    else:
-                        # check UUPS
-                        abi = """
-                                [{
-                                    "inputs": [],
-                                    "name": "getImplementation",
-                                    "outputs": [{"internalType": "address", "name": "", "type": "address"}],
-                                    "stateMutability": "view",
-                                    "type": "function"
-                                }]
-                                """
-
-                        contract = self.w3.eth.contract(address=addr, abi=abi)
-                        try:
-                            impl_addr = contract.functions.getImplementation().call()
-                            print(f"The implementation address is: {impl_addr}, {addr} is likely a UUPS contract")
-                        except Exception as e:
-                            print(f"Error retrieving implementation address: {e}, {addr} is likely not a UUPS contract")
-
-                            # finally check for diamond cut (skipping for now as we don't know which one is the right impl_addr)
-
-
-
-
-            # in case, needed we can check the value of impl_addr here.
-
-            logger.info(f'saving proxy mapping for {addr}')
-            self.check_dir(f"./proxy_mapping")
-            with open(cached_file, 'w') as outfile:
-                json.dump(impl_addr, outfile)
-                
+        # slots of known proxy patterns are read in one JSON-RPC batch, etherscan verified source code as fallback (see proxy_resolver.py)
+        impl_addr = self.proxies.resolve(addr, etherscan_source=lambda contract_addr: self.get_etherscan_source_code(contract_addr, ETHERSCAN_API))
         return impl_addr
     
     def decode_input(self, hex_input, contract_addr, contract_abi):
-        contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi)
-
-        # check if it is a proxy contract 
-        impl_check = 'implementation' in contract_abi.lower()
-        upgrade_check = 'upgrade' in contract_abi.lower()
-        verdict = impl_check and upgrade_check
-        if(verdict):
-            logger.info(f'found a proxy contract ({contract_addr}). Fetching the implementation function to get the matching contract (for now only openzeppelin upgradable proxy is handled.)')
-            # somehow nowadays proxy contracts prevent clients from calling implementation function directly.
-            #implementation_address = contract.functions.implementation().call()
-
-            # check first if there is cached data ("get_storage_at" can be expensive in terms of compute unit)
-            impl_addr = self.get_proxy_mapping(contract_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
-
-            # for openzeppelin upgradable template
-            # padded = Web3.toHex(self.w3.eth.get_storage_at(contract_addr, "0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3"))
-            # padded = padded[-42:]
-            # impl_addr = '0x' + padded[2:]
-            
-            if(impl_addr=='0x0000000000000000000000000000000000000000'):
-                logger.info(f'found a proxy but {contract_addr} is not using openzeppelin upgradable contract... moving on')
-                func = hex_input[:10]
-                params = 'unknown_proxy' 
-                return func, params
+        # parsed abi, proxy verdict, implementation abi and the Contract object are memoized per contract (see contract_cache.py)
+        entry = contract_cache.get_contract_entry(self, contract_addr, contract_abi)
 
-            else:
-                logger.info(f'found a proxy contract that probably is an upgradable contract')
-                impl_addr = Web3.to_checksum_address(impl_addr)
-                contract_abi, verdict = self.get_contract_abi(impl_addr, ETHERSCAN_API=self.apis['ETHERSCAN_API'])
-                contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi)
+        if(entry.unknown_proxy):
+            logger.info(f'found a proxy but {contract_addr} is not using a known upgradable proxy pattern... moving on')
+            func = hex_input[:10]
+            params = 'unknown_proxy' 
+            return func, params
+        if(entry.decoder is None):
+            raise ValueError(f'ABI of the implementation contract {entry.impl_addr} (proxy : {contract_addr}) is not available')
         
-        func, params = contract.decode_function_input(hex_input)
+        # selector lookup + eth_abi decode (same (function, params) shape as contract.decode_function_input)
+        func, params = entry.decoder.decode(hex_input)
 
         return func, params
     # not used for now.
@@ -494,6 +482,8 @@ class Transfer_Decoder():
 
             # get denominator
             decimal = contract.functions.decimals().call()
+            if(not isinstance(decimal, int) or decimal < 0 or decimal > MAX_DECIMALS):
+                raise ValueError(f'decimals() returned {decimal}')
 
             call_results= {}
             if(type(symbol)==bytes): # MKR does this...
@@ -514,36 +504,45 @@ class Transfer_Decoder():
 
         return call_results
 
+    def prefetch_erc20_denoms(self, token_addrs):
+        """
+        resolves symbol/decimals of every token not cached yet with aggregated calls (Multicall3, JSON-RPC batch as fallback)
+        and writes all results to the metadata store in one transaction.
+        """
+        unseen = [to_checksum_address(addr) for addr in pd.unique(pd.Series(list(token_addrs)).dropna()) if self.store.get_call(addr) is None]
+        if(len(unseen)==0):
+            return
+        logger.info(f'fetching symbol and decimals of {len(unseen)} tokens')
+        calls = []
+        for addr in unseen:
+            calls.append((addr, SYMBOL_SELECTOR))
+            calls.append((addr, DECIMALS_SELECTOR))
+        try:
+            returned = multicall.aggregate3(self.w3, calls)
+        except Exception as e:
+            logger.error(f'multicall failed ({e}), sending the calls as JSON-RPC batches')
+            returned = multicall.batch_eth_calls(self.w3, calls)
+
+        results = {}
+        for ii, addr in enumerate(unseen):
+            results[addr] = parse_symbol_decimal(addr, returned[2*ii], returned[2*ii+1])
+        self.store.put_calls(results)
+        print(f"call data saved for {len(results)} tokens")
+
     def get_erc20_denom(self, contract_address):
         
 
         # check cache 
-        cache_root = f'{self.ET_root}/calls'
-        cached_file = f"{self.ET_root}/calls/{contract_address}.txt"
-        
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                call_results = json.load(infile)
-                print(f"using cached call results for {contract_address}")
-                if(type(call_results['symbol'])!=bytes): # checking for problems in locally-cached files
-
-                    return call_results['symbol'], call_results['decimal']
-                else:
-                    call_results = self.get_symbol_decimal_erc20(contract_address)
-                    # save results 
-                    self.check_dir(cache_root)
-                    with open(cached_file, 'w') as outfile:
-                        json.dump(call_results, outfile)
-                        print(f"call data saved for {contract_address}")
+        call_results = self.store.get_call(contract_address)
+        if call_results is not None:
+            print(f"using cached call results for {contract_address}")
 
         else:
             
             call_results = self.get_symbol_decimal_erc20(contract_address)
             # save results 
-            self.check_dir(cache_root)
-            with open(cached_file, 'w') as outfile:
-                json.dump(call_results, outfile)
-                print(f"call data saved for {contract_address}")
+            self.store.put_call(contract_address, call_results)
+            print(f"call data saved for {contract_address}")
 
         # if(contract_address.lower()=='0xa2327a938febf5fec13bacfb16ae10ecbc4cbdcf'):
         #     symbol = 'USDC'
@@ -759,14 +758,20 @@ class Transfer_Decoder():
             data = response.json()
             if 'results' in data and len(data['results']) > 0:
                 logger.info(f'fetched function/event signature for the hex signature : {hex_signature}')
-                return data['results'][0]['text_signature']
+                # keep every colliding signature, ranked by their 4byte id (a selector without any valid result is stored as a miss)
+                if self.signatures.put_signatures([(hex_signature, entry['text_signature'], entry['id']) for entry in data['results']]) > 0:
+                    return self.signatures.lookup(hex_signature)[1]
+            self.signatures.put_miss(hex_signature)
         logger.info(f'no matching text signature for {hex_signature}')
         return None
     
     def public_library_check(self, hex_input):
         # get first 8 hex digits (4 bytes) + 2 (0x)
         hex_signature = hex_input[:10] 
-        text_signature = self.query_public_library(hex_signature)
+        # local signature database first (see signature_db.py), 4byte.directory only for selectors never seen before
+        known, text_signature = self.signatures.lookup(hex_signature)
+        if(not known):
+            text_signature = self.query_public_library(hex_signature)
         if(text_signature is None):
             logger.error(f'input hex : {hex_signature} was not found in the public library. Input cannot be decoded')
             decoded = hex_signature
@@ -776,25 +781,21 @@ class Transfer_Decoder():
     
     def get_contract_abi(self, addr:str, ETHERSCAN_API=None):
         
-        # make/check local cache 
-        cached_file = f"{self.ET_root}/bytecode/{addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                code = json.load(infile)
-                print(f"using cached bytecode for {addr}")
+        # check local cache (only the is-contract flag and the code hash are kept)
+        cached = self.store.get_code(addr)
+        if cached is not None:
+            is_contract, code_hash = cached
+            print(f"using cached bytecode for {addr}")
             
         else:
             print(f"fetching bytecode for {addr}")
             code = self.w3.eth.get_code(addr) # expensive when using rpc services 
-
-            self.check_dir(f"{self.ET_root}/bytecode")
-            with open(cached_file, 'w') as outfile:
-                json.dump(code.hex(), outfile)
-                print('bytecode saved')
+            is_contract, code_hash = self.store.put_code(addr, code)
+            print('bytecode saved')
 
 
         # Check if the address is a contract account
-        if code == '0x':
+        if not is_contract:
             print(f"{addr} is an EOA")
             return None, 'eoa'
         else:
@@ -803,81 +804,80 @@ class Transfer_Decoder():
             return contract_abi, 'contract'
         
     def get_etherscan_source_code(self, contract_addr:str, ETHERSCAN_API=None):
-        cached_file =  f"{self.ET_root}/verified_source/{contract_addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                sc_result = json.load(infile)
-                if RETRY_UNVERIFIED==False and sc_result=='Contract source code not verified': #--> abi not usable
-                    logger.info(f'source code fetching step is ignored for {contract_addr} as previous attempts were not successful. In case you want to force fetching please set global var RETRY_UNVERIFIED to True in Eth_ETL.py')
-                    return 
-                else:
-                    if sc_result!='Max rate limit reached': # checks for previous rate limit problem
-                        print("using cached source code")
-                        return sc_result
-        
-        url = f"https://api.etherscan.io/api?module=contract&action=getsourcecode&address={contract_addr}&apikey={ETHERSCAN_API}"
-        response = self.get_url(url)
-        res = response.json()
+        cached = self.store.get_source(contract_addr)
+        if cached is not None:
+            verified, sc_result = cached
+            if not verified: #--> abi not usable
+                logger.info(f'source code fetching step is ignored for {contract_addr} as previous attempts were not successful. The contract is looked up again after metadata_store.NEGATIVE_TTL seconds')
+                return 
+            else:
+                print("using cached source code")
+                return sc_result
+        
+        # requested once per address over all processes, rate shaped (see etherscan_broker.py)
+        fetched = self.etherscan.fetch('getsourcecode', contract_addr, ETHERSCAN_API,
+                                       lookup=lambda: self.store.get_source(contract_addr),
+                                       handle=lambda res: self.save_source_result(contract_addr, res))
+        if(fetched is None or not(fetched[0])):
+            return # contract cannot be initialized with abi (could use function signatures for targeted approach)
+        return fetched[1]
 
+    def save_source_result(self, contract_addr, res):
+        # stores an etherscan getsourcecode answer, returns (verified, result) like store.get_source
+        if(res is None):
+            logger.error(f'fetching verified source code for {contract_addr} from etherscan failed')
+            return None
         if res['status'] == '1':
-            self.check_dir(f"{self.ET_root}/verified_source")
-            with open(cached_file, 'w') as outfile:
-                json.dump(res['result'], outfile)
-                print('verified source code saved')
-
-            return res['result']
-            
+            self.store.put_source(contract_addr, res['result'], verified=True)
+            print('verified source code saved')
+            return True, res['result']
         else:
             print(f"Error: {res['message']} Result: {res['result']}")    
-            self.check_dir(f"{self.ET_root}/abis")
-            with open(cached_file, 'w') as outfile:
-                json.dump(res['result'], outfile)
-                print(f'There was an error when fetching verified source code for {contract_addr}, saved the error msg in verified_source folder')
-            
-            return # contract cannot be initialized with abi (could use function signatures for targeted approach)
+            self.store.put_source(contract_addr, res['result'], verified=False)
+            print(f'There was an error when fetching verified source code for {contract_addr}, saved the error msg as a negative entry')
+            return False, res['result']
 
 
         
     def get_abi(self, contract_addr:str, ETHERSCAN_API=None, contract_type=None):
         # check its its cached/called before
-        cached_file =  f"{self.ET_root}/abis/{contract_addr}.txt"
-        if os.path.exists(cached_file):
-            with open(cached_file, 'r') as infile:
-                abi_result = json.load(infile)
-                if RETRY_UNVERIFIED==False and abi_result=='Contract source code not verified': #--> abi not usable
-                    logger.info(f'ABI fetching step is ignored for {contract_addr} as previous attempts were not successful. In case you want to force fetching please set global var RETRY_UNVERIFIED to True in Eth_ETL.py')
-                    return 
-                else:
-                    if abi_result!='Max rate limit reached': # checks for previous rate limit problem
-                        print("using cached abi")
-                        return abi_result
-        
-        url = f"https://api.etherscan.io/api?module=contract&action=getabi&address={contract_addr}&apikey={ETHERSCAN_API}"
-        response = self.get_url(url)
-        res = response.json()
-
+        cached = self.store.get_abi(contract_addr)
+        if cached is not None:
+            verified, abi_result = cached
+            if not verified: #--> abi not usable
+                logger.info(f'ABI fetching step is ignored for {contract_addr} as previous attempts were not successful. The contract is looked up again after metadata_store.NEGATIVE_TTL seconds')
+                return 
+            else:
+                print("using cached abi")
+                return abi_result
+        
+        # requested once per address over all processes, rate shaped (see etherscan_broker.py)
+        fetched = self.etherscan.fetch('getabi', contract_addr, ETHERSCAN_API,
+                                       lookup=lambda: self.store.get_abi(contract_addr),
+                                       handle=lambda res: self.save_abi_result(contract_addr, res))
+        if(fetched is None or not(fetched[0])):
+            return # contract cannot be initialized with abi (could use function signatures for targeted approach)
+        return str(fetched[1])
 
+    def save_abi_result(self, contract_addr, res):
+        # stores an etherscan getabi answer, returns (verified, abi or error msg) like store.get_abi
+        if(res is None):
+            logger.error(f'fetching abi for {contract_addr} from etherscan failed')
+            return None
         if res['status'] == '1':
-            self.check_dir(f"{self.ET_root}/abis")
-            with open(cached_file, 'w') as outfile:
-                json.dump(res['result'], outfile)
-                print('abi saved')
-
-            return str(res['result'])
-            
+            self.store.put_abi(contract_addr, res['result'], verified=True)
+            print('abi saved')
+            return True, res['result']
         else:
             print(f"Error: {res['message']} Result: {res['result']}")    
-            self.check_dir(f"{self.ET_root}/abis")
-            with open(cached_file, 'w') as outfile:
-                json.dump(res['result'], outfile)
-                print(f'There was an error when fetching abi for {contract_addr}, saved the error msg in abi folder')
-            
-            return # contract cannot be initialized with abi (could use function signatures for targeted approach)
+            self.store.put_abi(contract_addr, str(res['result']), verified=False)
+            print(f'There was an error when fetching abi for {contract_addr}, saved the error msg as a negative entry')
+            return False, str(res['result'])
     
         
     def abi_handler_addr_pos(self, search_addr, ETHERSCAN_API=None):
             # check if the interacting address is a contract
-        search_addr = Web3.to_checksum_address(search_addr)
+        search_addr = to_checksum_address(search_addr)
         contract_abi, verdict = self.get_contract_abi(search_addr, ETHERSCAN_API)
         if(contract_abi is None):
             print(f"ABI for the contract {search_addr} is not recoverable.")
@@ -887,71 +887,77 @@ class Transfer_Decoder():
 ###################################################################################################
     
     # for decoding logs
-    def decode_logs_csv(self, csv_file):
-        csv_df = pd.read_csv(csv_file)
- 
-        # this concat df includes multiple tx positions in a chronological order.
-        logger.info(f'decoding csv file : {csv_file}, number of logs (rows): {len(csv_df)}')        
-        concat = pd.DataFrame() 
-        for ii, log in csv_df.iterrows():
-            
-            # decode log data
-            contract_addr = log['address']
-            contract_abi = self.get_abi(contract_addr, self.apis['ETHERSCAN_API'])# Your contract ABI here
-            if(contract_abi is None):
-                logger.error(f'failed to fetch abi for {contract_addr}')
-                logger.info(f'continuing')
-                continue
-            else:
-                # create contract instance
-                contract = self.w3.eth.contract(address=contract_addr, abi=contract_abi) 
-                #get abi mapping (events)
-                event_abi_map = self.generate_event_abi_map(contract_abi)
-                #decode the log
-                decoded_data = self._decode_log(log, event_abi_map, contract)
-            
-                # prep decoded result variable
-                decoded = {}
-                decoded['blockNumber'] = log['blockNumber']
-                decoded['tx_hash'] = log['transactionHash']
-                decoded['tx_index'] = log['transactionIndex']
-                decoded['log_index'] = log['logIndex']
-                decoded['contract_addr'] = log['address']
-                decoded['event'] = decoded_data['event']
-                decoded['decoded'] = str(dict(decoded_data['args']))
-
-                decode_df = pd.DataFrame(decoded, index=[0])
-                concat = pd.concat([concat, decode_df])
-            
-        
-        concat = concat.reset_index(drop='index')
-        
+    def decode_logs_csv(self, csv_file, chunksize=LOG_CHUNK_ROWS):
+        # whole decoded file as one dataframe (use decode_logs_csv_to_file for large exports)
+        chunks = list(self.decode_logs_chunks(csv_file, chunksize))
+        concat = pd.concat(chunks).reset_index(drop=True)
         return concat
-    
-    # Generate a dictionary mapping event signature hashes to event ABIs
-    def generate_event_abi_map(self, contract_abi):
-        json_abi = json.loads(contract_abi)
-        event_abi_map = {}
-        for abi_entry in json_abi:
-            # print(abi_entry)
-            if abi_entry['type'] == 'event':
-                event_signature = f"{abi_entry['name']}({','.join([input['type'] for input in abi_entry['inputs']])})"
-                event_signature_hash = self.w3.keccak(text=event_signature).hex()
-                event_abi_map[event_signature_hash] = abi_entry    
-        return event_abi_map                    
-        
-    def _decode_log(self, log, event_abi_map, contract):
-        # Match the event signature hash
-        event_signature_hash = ast.literal_eval(log['topics'])[0] if log['topics'] else None
-        event_abi = event_abi_map.get(event_signature_hash)
-
-        if event_abi:
-            # Decode the log based on the matched event ABI
-            log['topics'] = ast.literal_eval(log['topics'])
-            log['topics'] = list(map(lambda x: bytes.fromhex(x[2:]),log['topics']))
-            return contract.events[event_abi['name']]().process_log(log)
-        else:
-            return None
+
+    def decode_logs_csv_to_file(self, csv_file, out_file, chunksize=LOG_CHUNK_ROWS):
+        # decodes and writes chunk by chunk, memory is bounded by the chunk size
+        n_decoded = 0
+        for ii, decoded in enumerate(self.decode_logs_chunks(csv_file, chunksize)):
+            decoded.to_csv(out_file, index=False, mode='w' if ii==0 else 'a', header= ii==0)
+            n_decoded += len(decoded)
+        return n_decoded
+
+    def decode_logs_chunks(self, csv_file, chunksize=LOG_CHUNK_ROWS):
+        # fetch and index the abi of every contract first (so the global event index is complete before decoding)
+        addresses = pd.read_csv(csv_file, usecols=['address'])['address'].unique()
+        logger.info(f'decoding csv file : {csv_file}, number of contracts : {len(addresses)}')
+        abis = {} # contract address -> abi (None if not available)
+        for contract_addr in addresses:
+            abis[contract_addr] = self.get_abi(contract_addr, self.apis['ETHERSCAN_API'])
+            if(abis[contract_addr] is None):
+                logger.error(f'failed to fetch abi for {contract_addr}, using the global event index for its logs')
+            else:
+                self.events.contract_events(contract_addr, abis[contract_addr])
+
+        for csv_df in pd.read_csv(csv_file, chunksize=chunksize):
+            logger.info(f'decoding {len(csv_df)} logs (rows)')
+            yield self.decode_logs_frame(csv_df, abis)
+
+    def decode_logs_frame(self, csv_df, abis):
+        """
+        decodes a dataframe of exported logs (format of get_logs). Topics are parsed in one vectorized pass, rows are grouped
+        by (address, topic0, number of topics) and every group is decoded with one prepared decoder (see event_index.py).
+        output rows keep the order of the input.
+        """
+        csv_df = csv_df.reset_index(drop=True)
+        topics = csv_df['topics'].astype(str).str.findall(TOPIC_PATTERN)
+        keys = pd.DataFrame({'address': csv_df['address'], 'topic0': topics.str[0].str.lower(), 'n_topics': topics.str.len()})
+        keys = keys[keys['n_topics']>0]
+        topics = topics.to_numpy()
+        data = csv_df['data'].fillna('0x').to_numpy()
+
+        positions, events, decoded_args = [], [], []
+        for (contract_addr, topic0, n_topics), group in keys.groupby(['address', 'topic0', 'n_topics'], sort=False):
+            event_abi = self.events.lookup(contract_addr, abis.get(contract_addr), topic0, n_topics)
+            if(event_abi is None):
+                logger.info(f'no matching event abi for {len(group)} logs of {contract_addr} (topic0 : {topic0}), continuing')
+                continue
+            decoder = self.events.get_decoder(event_abi)
+            for pos in group.index:
+                try:
+                    args = decoder.decode([bytes.fromhex(topic[2:]) for topic in topics[pos][1:]], bytes.fromhex(data[pos][2:]))
+                except Exception as e:
+                    logger.error(f'decoding the log {csv_df["transactionHash"][pos]}:{csv_df["logIndex"][pos]} failed : {e}')
+                    continue
+                positions.append(pos)
+                events.append(decoder.name)
+                decoded_args.append(str(args))
+
+        order = np.argsort(np.asarray(positions, dtype=np.int64), kind='stable')
+        positions = np.asarray(positions, dtype=np.int64)[order]
+        decoded = pd.DataFrame({'blockNumber': csv_df['blockNumber'].to_numpy()[positions],
+                                'tx_hash': csv_df['transactionHash'].to_numpy()[positions],
+                                'tx_index': csv_df['transactionIndex'].to_numpy()[positions],
+                                'log_index': csv_df['logIndex'].to_numpy()[positions],
+                                'contract_addr': csv_df['address'].to_numpy()[positions],
+                                'event': np.asarray(events, dtype=object)[order],
+                                'decoded': np.asarray(decoded_args, dtype=object)[order]})
+        return decoded
+
 
 # import eth_utils
 # eth_utils.abi.event_abi_to_log_topic(event_abi)
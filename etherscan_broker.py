@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import zlib
+import threading
+import logging
+import http_session
+import metadata_store
+
+try:
+    import fcntl
+except ImportError: # no cross-process locking on this platform, the limits then apply per process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+ETHERSCAN_URL = 'https://api.etherscan.io/api'
+RATE = float(os.getenv('ETHERSCAN_RATE', 5)) # requests per second shared by all processes using the same state folder (free api keys : 5/s)
+BURST = float(os.getenv('ETHERSCAN_BURST', RATE)) # bucket size
+STATE_DIR = os.getenv('ETHERSCAN_STATE_DIR', './cache/etherscan')
+LOCK_STRIPES = 1024 # per-address locks are striped over this many lock files
+MAX_TRIES = 10
+
+_BROKERS = {}
+_BROKERS_LOCK = threading.Lock()
+
+
+class File_lock():
+    """
+    exclusive lock held by one thread of one process at a time (thread lock + flock on a lock file).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.thread_lock = threading.Lock()
+        self.handle = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if fcntl is not None:
+            self.handle = open(self.path, 'a+')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+        self.thread_lock.release()
+
+
+class Token_bucket():
+    """
+    token bucket kept in a small json file, shared by every process using the same file.
+    """
+    def __init__(self, path, rate=RATE, burst=BURST):
+        self.path = path
+        self.rate = rate
+        self.burst = burst
+        self.lock = File_lock(path + '.lock')
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as infile:
+                state = json.load(infile)
+            return state['tokens'], state['updated']
+        except Exception:
+            return self.burst, time.time()
+
+    def _write(self, tokens, updated):
+        tmp_file = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file, 'w') as outfile:
+            json.dump({'tokens': tokens, 'updated': updated}, outfile)
+        os.replace(tmp_file, self.path)
+
+    def acquire(self):
+        # blocks until a token is available
+        while True:
+            with self.lock:
+                now = time.time()
+                tokens, updated = self._read()
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+                if tokens >= 1:
+                    self._write(tokens - 1, now)
+                    return
+                self._write(tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds=1.0):
+        # called when etherscan still answers with a rate limit error : every process backs off for `seconds`
+        with self.lock:
+            self._write(-seconds * self.rate, time.time())
+
+
+class Etherscan_broker():
+    """
+    single entry point for etherscan api calls of all eth-tracker processes on this machine.
+
+    - requests are shaped by a token bucket shared through STATE_DIR (RATE requests per second over all processes).
+    - concurrent requests for the same (action, address) collapse into one fetch : the caller's cache lookup is
+      repeated after acquiring the per-address lock, so waiters get the result stored by the first fetch.
+    - rate limit answers are retried here and never handed back to the callers.
+    """
+    def __init__(self, state_dir=STATE_DIR, rate=RATE, burst=BURST):
+        self.state_dir = state_dir
+        os.makedirs(os.path.join(state_dir, 'locks'), exist_ok=True)
+        self.bucket = Token_bucket(os.path.join(state_dir, 'bucket.json'), rate, burst)
+        self.locks = {}
+        self.locks_guard = threading.Lock()
+
+    def address_lock(self, action, address):
+        stripe = zlib.crc32(f'{action}:{address.lower()}'.encode()) % LOCK_STRIPES
+        with self.locks_guard:
+            if stripe not in self.locks:
+                self.locks[stripe] = File_lock(os.path.join(self.state_dir, 'locks', f'{stripe}.lock'))
+            return self.locks[stripe]
+
+    def request(self, action, address, api_key):
+        """
+        returns the json answer of etherscan (module=contract), None if no usable answer was received after MAX_TRIES attempts.
+        """
+        url = f"{ETHERSCAN_URL}?module=contract&action={action}&address={address}&apikey={api_key}"
+        for attempt in range(MAX_TRIES):
+            self.bucket.acquire()
+            try:
+                response = http_session.get(url, timeout=30)
+            except Exception as e:
+                logger.error(f'etherscan {action} request for {address} failed : {e}')
+                continue
+            if response.status_code != 200:
+                logger.error(f'etherscan {action} request for {address} returned status {response.status_code} (attempt {attempt + 1} of {MAX_TRIES})')
+                self.bucket.drain()
+                continue
+            res = response.json()
+            if metadata_store.RATE_LIMIT_MSG in str(res.get('result')):
+                logger.info(f'etherscan rate limit reached, backing off (attempt {attempt + 1} of {MAX_TRIES})')
+                self.bucket.drain()
+                continue
+            return res
+        logger.error(f'etherscan {action} request for {address} failed {MAX_TRIES} times')
+        return None
+
+    def fetch(self, action, address, api_key, lookup, handle):
+        """
+        lookup() returns the cached value (or None), handle(res) stores an etherscan answer (res is None if the request failed)
+        and returns the value. Both run under the per-address lock, so each address is requested once per action.
+        """
+        with self.address_lock(action, address):
+            cached = lookup()
+            if cached is not None:
+                return cached
+            res = self.request(action, address, api_key)
+            return handle(res)
+
+
+def get_broker(state_dir=None):
+    # one broker per process and state folder
+    state_dir = state_dir or STATE_DIR
+    with _BROKERS_LOCK:
+        if state_dir not in _BROKERS:
+            _BROKERS[state_dir] = Etherscan_broker(state_dir)
+        return _BROKERS[state_dir]
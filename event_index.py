@@ -0,0 +1,146 @@
+import json
+import threading
+import logging
+from eth_utils import keccak
+from eth_abi.grammar import parse as parse_abi_type
+import abi_decoder
+
+logger = logging.getLogger(__name__)
+
+
+# Transfer(address,address,uint256) topic, erc20 (value in data) and erc721 (indexed tokenId) layouts.
+# used when no indexed contract declares the event
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+STANDARD_EVENTS = {
+    (TRANSFER_TOPIC, 3): {'anonymous': False, 'name': 'Transfer', 'type': 'event', 'inputs': [
+        {'indexed': True, 'name': 'from', 'type': 'address'}, {'indexed': True, 'name': 'to', 'type': 'address'}, {'indexed': False, 'name': 'value', 'type': 'uint256'}]},
+    (TRANSFER_TOPIC, 4): {'anonymous': False, 'name': 'Transfer', 'type': 'event', 'inputs': [
+        {'indexed': True, 'name': 'from', 'type': 'address'}, {'indexed': True, 'name': 'to', 'type': 'address'}, {'indexed': True, 'name': 'tokenId', 'type': 'uint256'}]},
+}
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def event_entries(parsed_abi):
+    """
+    [(topic0, n_topics, event abi), ...] for the events of an ABI.
+    n_topics (topic0 + indexed inputs) is part of the key because e.g. the erc20 and erc721 Transfer events share topic0.
+    anonymous events have no topic0 and are skipped.
+    """
+    entries = []
+    for entry in parsed_abi:
+        if entry.get('type') != 'event' or entry.get('anonymous', False):
+            continue
+        inputs = entry.get('inputs', [])
+        signature = f"{entry['name']}({','.join(abi_decoder.abi_type(param) for param in inputs)})"
+        topic0 = '0x' + keccak(text=signature).hex()
+        n_topics = 1 + sum(1 for param in inputs if param.get('indexed', False))
+        entries.append((topic0, n_topics, entry))
+    return entries
+
+
+class Event_decoder():
+    """
+    decoder prepared once per event ABI, gives the same args as web3's get_event_data :
+    indexed inputs first (dynamic indexed types are returned as their 32-byte topic), then the data inputs.
+    """
+    def __init__(self, event_abi):
+        self.name = event_abi['name']
+        inputs = event_abi.get('inputs', [])
+        self.topic_params = [param for param in inputs if param.get('indexed', False)]
+        self.data_params = [param for param in inputs if not param.get('indexed', False)]
+        self.topic_types = []
+        for param in self.topic_params:
+            type_str = abi_decoder.abi_type(param)
+            self.topic_types.append('bytes32' if parse_abi_type(type_str).is_dynamic else type_str)
+        # bytes32 replacements are not normalized any further
+        self.topic_params = [param if type_str != 'bytes32' else dict(param, type='bytes32') for param, type_str in zip(self.topic_params, self.topic_types)]
+        self.data_types = [abi_decoder.abi_type(param) for param in self.data_params]
+
+    def decode(self, topics, data):
+        # topics : 32-byte topics without topic0, data : log data as bytes
+        args = {}
+        for param, type_str, topic in zip(self.topic_params, self.topic_types, topics):
+            args[param['name']] = abi_decoder.normalize_value(param, abi_decoder.abi_decode([type_str], topic)[0])
+        values = abi_decoder.abi_decode(self.data_types, data) if len(self.data_types) else []
+        for param, value in zip(self.data_params, values):
+            args[param['name']] = abi_decoder.normalize_value(param, value)
+        return args
+
+
+class Event_index():
+    """
+    topic0 -> event ABI index, kept in memory and persisted in the metadata store (events table).
+
+    every contract is indexed once (when its ABI is first seen), the per-contract entries are merged into a global
+    (topic0, number of topics) index that is used for logs of contracts without a usable ABI (unverified contracts,
+    proxies emitting the events of their implementation, ...).
+    """
+    def __init__(self, store):
+        self.store = store
+        self.contracts = {} # address -> {(topic0, n_topics): event abi}
+        self.merged = {} # (topic0, n_topics) -> event abi or None
+        self.decoders = {} # event abi (json) -> Event_decoder
+        self.lock = threading.Lock()
+
+    def contract_events(self, address, contract_abi):
+        address = address.lower()
+        events = self.contracts.get(address)
+        if events is None:
+            stored = self.store.get_events(address)
+            if stored is not None:
+                events = {key: json.loads(abi) for key, abi in stored.items()}
+            else:
+                entries = event_entries(json.loads(contract_abi))
+                events = {(topic0, n_topics): abi for topic0, n_topics, abi in entries}
+                if len(entries):
+                    self.store.put_events(address, [(topic0, n_topics, json.dumps(abi)) for topic0, n_topics, abi in entries])
+            with self.lock:
+                self.contracts[address] = events
+                for key, abi in events.items():
+                    if self.merged.get(key) is None or self.merged[key] is STANDARD_EVENTS.get(key):
+                        self.merged[key] = abi
+        return events
+
+    def global_event(self, topic0, n_topics):
+        key = (topic0, n_topics)
+        if key not in self.merged:
+            abi = self.store.find_event(topic0, n_topics)
+            with self.lock:
+                self.merged[key] = STANDARD_EVENTS.get(key) if abi is None else json.loads(abi)
+        return self.merged[key]
+
+    def lookup(self, address, contract_abi, topic0, n_topics):
+        """
+        event abi for a log : the contract's own ABI first (if available), then the global index. None if unknown.
+        """
+        topic0 = topic0.lower()
+        if contract_abi is not None:
+            event_abi = self.contract_events(address, contract_abi).get((topic0, n_topics))
+            if event_abi is not None:
+                return event_abi
+        return self.global_event(topic0, n_topics)
+
+    def get_decoder(self, event_abi):
+        key = json.dumps(event_abi, sort_keys=True)
+        decoder = self.decoders.get(key)
+        if decoder is None:
+            decoder = Event_decoder(event_abi)
+            with self.lock:
+                self.decoders[key] = decoder
+        return decoder
+
+
+def decode_log(w3, event_abi, log_entry):
+    # log_entry needs topics (bytes), data and the usual log fields (address, blockNumber, transactionHash, ...)
+    from web3._utils.events import get_event_data
+    return get_event_data(w3.codec, event_abi, log_entry)
+
+
+def get_event_index(store):
+    # one index per process and metadata store
+    with _INDEXES_LOCK:
+        if id(store) not in _INDEXES:
+            _INDEXES[id(store)] = Event_index(store)
+        return _INDEXES[id(store)]
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import threading
+import logging
+import block_stream
+
+logger = logging.getLogger(__name__)
+
+
+# follow jobs -> (range job used to fetch/match/write a block, address position), see Eth_tracker.process_range_block
+FOLLOW_JOBS = {
+    'contracts_from': ('contracts_range', 'from'),
+    'contracts_to': ('contracts_range', 'to'),
+    'txs_from': ('txs_range', 'from'),
+    'txs_to': ('txs_range', 'to'),
+    'traces_from': ('traces_range', 'from'),
+    'traces_to': ('traces_range', 'to'),
+}
+STATE_DIR = './output/follow'
+REORG_WINDOW = 128 # hashes (and written outputs) of the most recent blocks kept for reorg detection, deeper reorgs cannot be retracted
+POLL_INTERVAL = 4 # seconds between head polls once the follower has caught up
+MAX_BLOCK_ATTEMPTS = 5 # a block whose processing raised this many times is recorded as failed and skipped
+
+
+class Follow_state():
+    """
+    persisted progress of a follower : the watermark (last processed block) and, for the last REORG_WINDOW blocks,
+    the block hash and the files written for it. Saved atomically (tmp file + rename) after every block.
+    every processed / retracted / failed block is also appended to <state file>.events (json lines) for downstream
+    consumers. Events are written before the state is saved, so a crash in between repeats them on restart
+    (at-least-once) : consumers dedupe on (event, number, hash), the last 'block' event of a number wins.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.events_path = path + '.events'
+        self.watermark = None
+        self.blocks = {} # block number -> {'hash': ..., 'outputs': [...]}
+        self.attempts = {} # block number -> failed processing attempts, the block is retried on the next poll
+        self.failed = [] # blocks given up after MAX_BLOCK_ATTEMPTS attempts (removed if processed after a reorg)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            with open(path, 'r') as infile:
+                state = json.load(infile)
+            self.watermark = state['watermark']
+            self.blocks = {int(block): entry for block, entry in state['blocks'].items()}
+            self.attempts = {int(block): count for block, count in state.get('attempts', {}).items()}
+            self.failed = state.get('failed', [])
+
+    def save(self):
+        tmp_file = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_file, 'w') as outfile:
+            json.dump({'watermark': self.watermark, 'blocks': self.blocks, 'attempts': self.attempts, 'failed': self.failed}, outfile)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(tmp_file, self.path)
+
+    def log_event(self, event, block, entry, **info):
+        with open(self.events_path, 'a') as outfile:
+            outfile.write(json.dumps(dict({'event': event, 'number': block, 'hash': entry['hash'], 'outputs': entry['outputs'], 'time': time.time()}, **info)) + '\n')
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+    def extends(self, block, parent_hash):
+        # False if the block does not build on the block processed before it (reorg)
+        previous = self.blocks.get(block - 1)
+        return previous is None or previous['hash'] == parent_hash
+
+    def add_block(self, block, block_hash, outputs):
+        self.blocks[block] = {'hash': block_hash, 'outputs': outputs}
+        self.watermark = block
+        self.attempts.pop(block, None)
+        if block in self.failed:
+            self.failed.remove(block)
+        for old in [old for old in self.blocks if old <= block - REORG_WINDOW]:
+            del self.blocks[old]
+
+    def retract_after(self, ancestor):
+        # removes the outputs of every recorded block above `ancestor` and moves the watermark back to it,
+        # the retract event of a block is written before its outputs are removed
+        for block in sorted([block for block in self.blocks if block > ancestor], reverse=True):
+            entry = self.blocks.pop(block)
+            self.log_event('retract', block, entry)
+            for out_file in entry['outputs']:
+                if os.path.exists(out_file):
+                    os.remove(out_file)
+            logger.info(f'retracted block {block} ({entry["hash"]}), {len(entry["outputs"])} output(s) removed')
+        self.watermark = ancestor
+
+
+class Head_follower():
+    """
+    follows the chain head : every new block is fetched, matched against the watchlist and written once,
+    the watermark is persisted after each block so a restarted follower resumes where it stopped.
+
+    each block has to build on the previously processed one (parentHash). If not, the follower walks back to the
+    last block whose recorded hash is still canonical, retracts the outputs written for the orphaned blocks and
+    processes the new canonical blocks from there.
+    """
+    def __init__(self, eth, job, state_file, start_block=None, end_block=None, confirmations=0,
+                 poll_interval=POLL_INTERVAL, read_ahead=block_stream.READ_AHEAD, ETHERSCAN_API=None, cache_blocks=False,
+                 max_attempts=MAX_BLOCK_ATTEMPTS):
+        self.eth = eth
+        self.eth.cache_range_blocks = cache_blocks
+        self.job = job
+        self.range_job, self.addr_pos = FOLLOW_JOBS[job]
+        self.state = Follow_state(state_file)
+        self.start_block = start_block
+        self.end_block = end_block
+        self.confirmations = int(confirmations)
+        self.poll_interval = poll_interval
+        self.read_ahead = read_ahead
+        self.ETHERSCAN_API = ETHERSCAN_API
+        self.max_attempts = max(int(max_attempts), 1)
+
+    def fetch(self, block):
+        # runs in the read-ahead threads : (block hash, parent hash, block data)
+        data = self.eth.fetch_range_block(self.range_job, block)
+        if(self.range_job == 'traces_range'):
+            header = self.eth.fetch_blockinfo(block_id=block, cache_write=self.eth.cache_range_blocks)
+            if(len(data) and data[0]['blockHash'] != header['hash'].hex()):
+                raise ValueError(f'traces and header of block {block} belong to different forks')
+        else:
+            header = data
+        return header['hash'].hex(), header['parentHash'].hex(), data
+
+    def canonical_hash(self, block):
+        return self.eth.w3.eth.get_block(block)['hash'].hex()
+
+    def handle_reorg(self, block):
+        # `block` does not extend the recorded chain : find the common ancestor and retract everything above it
+        ancestor = block - 1
+        while ancestor in self.state.blocks and self.canonical_hash(ancestor) != self.state.blocks[ancestor]['hash']:
+            ancestor -= 1
+        if(ancestor not in self.state.blocks and len(self.state.blocks) and ancestor < min(self.state.blocks)):
+            logger.error(f'reorg deeper than the {REORG_WINDOW} recorded blocks, outputs below block {ancestor + 1} cannot be retracted')
+        logger.info(f'reorg detected at block {block}, common ancestor : {ancestor} (depth {block - 1 - ancestor})')
+        self.state.retract_after(ancestor)
+        self.state.save()
+
+    def process(self, start_block, end_block):
+        """
+        processes [start_block, end_block]. Stops early on a reorg, a failed fetch or a block whose processing raised
+        (its partial outputs are removed), the next poll continues from the watermark. A block that raised
+        max_attempts times is recorded as failed (state file and a 'failed' event) and skipped.
+        """
+        stream = block_stream.stream_blocks(range(start_block, end_block + 1), self.fetch, self.read_ahead)
+        for block, fetched in stream:
+            if(isinstance(fetched, block_stream.Fetch_error)):
+                return
+            block_hash, parent_hash, data = fetched
+            if(not self.state.extends(block, parent_hash)):
+                self.handle_reorg(block)
+                return
+            self.eth.block_id = block
+            self.eth.written = []
+            try:
+                self.eth.process_range_block(self.range_job, data, self.addr_pos, self.ETHERSCAN_API)
+            except Exception as e:
+                for out_file in self.eth.written:
+                    if os.path.exists(out_file):
+                        os.remove(out_file)
+                attempts = self.state.attempts.get(block, 0) + 1
+                if(attempts < self.max_attempts):
+                    logger.error(f'processing block {block} failed (attempt {attempts} of {self.max_attempts}), retrying on the next poll : {e}')
+                    self.state.attempts[block] = attempts
+                    self.state.save()
+                    return
+                logger.error(f'processing block {block} failed {attempts} times, skipping it (listed as failed in {self.state.path}) : {e}')
+                self.state.add_block(block, block_hash, [])
+                self.state.failed.append(block)
+                self.state.log_event('failed', block, self.state.blocks[block], error=str(e))
+                self.state.save()
+                continue
+            self.state.add_block(block, block_hash, self.eth.written)
+            self.state.log_event('block', block, self.state.blocks[block])
+            self.state.save()
+            logger.info(f'follow {self.job} : block {block} processed ({len(self.eth.written)} output(s))')
+
+    def run(self):
+        if(self.state.watermark is not None):
+            logger.info(f'resuming {self.job} after block {self.state.watermark} ({self.state.path})')
+        while True:
+            target = self.eth.w3.eth.block_number - self.confirmations
+            if(self.end_block is not None):
+                target = min(target, int(self.end_block))
+            if(self.state.watermark is None):
+                self.state.watermark = (int(self.start_block) if self.start_block is not None else target) - 1
+            before = self.state.watermark
+            if(target > before):
+                self.process(before + 1, target)
+            if(self.end_block is not None and self.state.watermark >= int(self.end_block)):
+                logger.info(f'follow {self.job} : reached the end block {self.end_block}')
+                return
+            if(self.state.watermark == before): # caught up (or a block failed) : wait for the next head
+                time.sleep(self.poll_interval)
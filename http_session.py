@@ -0,0 +1,74 @@
+import os
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+# connection pool sizing (per process). pool_maxsize should be >= async_rpc.MAX_IN_FLIGHT so that concurrent requests reuse connections
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 8)) # number of hosts kept in the pool (rpc provider, etherscan, 4byte, defillama, ...)
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 32)) # keep-alive connections per host
+USE_GZIP = os.getenv('HTTP_GZIP', 'True') != 'False' # ask servers for gzip compressed responses
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def make_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, use_gzip=USE_GZIP):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+    if(use_gzip):
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+    else:
+        session.headers['Accept-Encoding'] = 'identity'
+    return session
+
+
+def get_session():
+    """
+    returns the process-wide session. Every rpc/rest caller goes through it so TCP+TLS connections are reused.
+    """
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = make_session()
+                logger.debug(f'http session initialized (pool_connections={POOL_CONNECTIONS}, pool_maxsize={POOL_MAXSIZE}, gzip={USE_GZIP})')
+    return _SESSION
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
+
+
+def post_batch(url, calls, timeout=None):
+    """
+    sends [(method, params), ...] as a single JSON-RPC batch request.
+    returns the results in the order of `calls`, entries that returned an error are None.
+    """
+    body = [{"jsonrpc": "2.0", "method": method, "params": params, "id": ii} for ii, (method, params) in enumerate(calls)]
+    response = post(url, json=body, timeout=timeout)
+    response.raise_for_status()
+    results = [None] * len(calls)
+    for entry in response.json():
+        if 'result' in entry:
+            results[entry['id']] = entry['result']
+        else:
+            # reverting eth_calls are expected in batches (e.g. probing getImplementation() on non-UUPS proxies)
+            logger.info(f"batch entry {calls[entry['id']]} returned an error : {entry.get('error')}")
+    return results
+
+
+def make_web3_provider(rpc_provider):
+    # web3 HTTPProvider sharing the same connection pool
+    from web3 import Web3
+    return Web3.HTTPProvider(rpc_provider, session=get_session())
@@ -0,0 +1,180 @@
+import os, sys
+import json
+import time
+import shlex
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import socketserver
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+
+HOST = '127.0.0.1'
+PORT = int(os.getenv('JOB_DAEMON_PORT', 8765))
+
+# per worker process state (web3 connection, api keys), set by init_worker
+_WORKER = {}
+
+
+def job_argv(line):
+    """
+    batch lines are written as commands ("python main.py get_logs -a ..."), only the part after main.py is the job.
+    """
+    tokens = shlex.split(line)
+    for ii, token in enumerate(tokens):
+        if token.endswith('main.py'):
+            return tokens[ii+1:]
+    return tokens
+
+
+def init_worker():
+    # runs once per worker : modules, .env, web3 connection and the caches behind them stay warm for all later jobs
+    import main
+    apis = main.load_apis()
+    _WORKER['main'] = main
+    _WORKER['apis'] = apis
+    _WORKER['w3'] = main.make_web3(apis)
+    for pipeline in main.PIPELINES: # main.py only imports the pipeline of its job, workers keep all of them loaded
+        main.load_pipeline(pipeline)
+
+
+def run_line(line):
+    """
+    runs one batch line in the worker, returns a status dict (never raises).
+    """
+    main = _WORKER['main']
+    start = time.time()
+    try:
+        args = main.arg_parser.get_args(job_argv(line))
+        main.setup_logging(args.job_id)
+        main.dispatch(args, _WORKER['w3'], _WORKER['apis'], main.get_date())
+        return {'line': line, 'status': 'ok', 'elapsed': time.time() - start}
+    except BaseException as e: # argparse errors raise SystemExit
+        logging.getLogger().error(f'job failed : {line}\n{traceback.format_exc()}')
+        return {'line': line, 'status': 'error', 'error': repr(e), 'elapsed': time.time() - start}
+
+
+class Job_handler(socketserver.StreamRequestHandler):
+    """
+    newline-delimited json protocol, one request per line :
+        {"id": <any>, "line": "<batch line>"}  ->  {"id": <any>, "line": ..., "status": "ok"|"error", "elapsed": ..., ["error": ...]}
+        {"cmd": "ping"} / {"cmd": "shutdown"}
+    jobs of one connection run concurrently, answers are written as jobs finish.
+    the connection is closed once the client has closed its sending side and all its jobs are answered.
+    """
+    def handle(self):
+        write_lock = threading.Lock()
+        pending = []
+
+        def reply(message):
+            # also called from the pool's result thread, a client that went away must not break it
+            try:
+                with write_lock:
+                    self.wfile.write((json.dumps(message) + '\n').encode())
+                    self.wfile.flush()
+            except OSError as e:
+                logger.error(f'could not send the result to the client : {e}')
+
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+            try:
+                request = json.loads(raw)
+            except ValueError:
+                reply({'status': 'error', 'error': 'request is not valid json'})
+                continue
+            cmd = request.get('cmd')
+            if cmd == 'ping':
+                reply({'status': 'ok', 'workers': self.server.num_workers})
+            elif cmd == 'shutdown':
+                reply({'status': 'ok'})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif 'line' in request:
+                request_id = request.get('id')
+                pending.append(self.server.pool.apply_async(run_line, (request['line'],),
+                                                            callback=lambda result, request_id=request_id: reply(dict(result, id=request_id))))
+            else:
+                reply({'status': 'error', 'error': f'unknown request : {request}'})
+        for job in pending:
+            job.wait()
+
+
+class Job_server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, num_workers):
+        self.num_workers = num_workers
+        self.pool = multiprocessing.Pool(num_workers, initializer=init_worker)
+        super().__init__(address, Job_handler)
+
+
+def serve(num_workers, host=HOST, port=PORT):
+    server = Job_server((host, port), num_workers)
+    logger.info(f'job daemon listening on {host}:{port} with {num_workers} workers')
+    try:
+        server.serve_forever()
+    finally:
+        server.pool.close()
+        server.pool.join()
+        server.server_close()
+
+
+def submit_lines(lines, host=HOST, port=PORT, on_result=None):
+    """
+    sends batch lines to a running daemon and returns their results (in the order of `lines`).
+    on_result(index, result) is called as soon as a job finishes.
+    """
+    results = [None] * len(lines)
+    with socket.create_connection((host, port)) as conn:
+        for ii, line in enumerate(lines):
+            conn.sendall((json.dumps({'id': ii, 'line': line}) + '\n').encode())
+        conn.shutdown(socket.SHUT_WR)
+        with conn.makefile('r') as answers:
+            for raw in answers:
+                result = json.loads(raw)
+                if isinstance(result.get('id'), int):
+                    results[result['id']] = result
+                    if on_result is not None:
+                        on_result(result['id'], result)
+    return results
+
+
+def send_command(cmd, host=HOST, port=PORT):
+    with socket.create_connection((host, port)) as conn:
+        conn.sendall((json.dumps({'cmd': cmd}) + '\n').encode())
+        conn.shutdown(socket.SHUT_WR)
+        with conn.makefile('r') as answers:
+            return json.loads(answers.readline())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="resident worker pool for eth-tracker jobs")
+    parser.add_argument("--host", type=str, default=HOST, help="address the daemon listens on")
+    parser.add_argument("--port", "-p", type=int, default=PORT, help="port the daemon listens on")
+    subparsers = parser.add_subparsers(dest="cmd", required=True)
+    serve_parser = subparsers.add_parser("serve", help="start the daemon")
+    serve_parser.add_argument("--num_process", "-n", type=int, default=os.cpu_count(), help="number of worker processes")
+    submit_parser = subparsers.add_parser("submit", help="run jobs on a running daemon")
+    submit_parser.add_argument("--batch_script", "-b", type=str, help="batch script, one eth-tracker job per line")
+    submit_parser.add_argument("--line", "-l", type=str, nargs='*', default=[], help="job lines")
+    subparsers.add_parser("ping", help="check if the daemon is running")
+    subparsers.add_parser("shutdown", help="stop the daemon")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+    if args.cmd == 'serve':
+        serve(args.num_process, args.host, args.port)
+    elif args.cmd == 'submit':
+        lines = list(args.line)
+        if args.batch_script is not None:
+            with open(args.batch_script, 'r') as infile:
+                lines += [line.strip() for line in infile.readlines() if line.strip()]
+        results = submit_lines(lines, args.host, args.port, on_result=lambda ii, result: print(json.dumps(result)))
+        sys.exit(0 if all(result is not None and result['status'] == 'ok' for result in results) else 1)
+    else:
+        print(json.dumps(send_command(args.cmd, args.host, args.port)))
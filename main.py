@@ -3,56 +3,88 @@
 import os, sys
 import logging
 from dotenv import load_dotenv
-from web3 import Web3
-import pandas as pd
+#loading API key and optional settings (before importing the modules that read them)
+load_dotenv()
 sys.path.append('./pipeline')
-import etl_pipeline, decode_pipeline, price_fetch_pipeline
+import importlib
 import arg_parser 
 import datetime
 
-# set datetime 
-now = datetime.datetime.now()
-# Format the date to 'day-month-year'
-DATE = now.strftime('%d%m%y')
 
+# pipeline modules (and web3, pandas behind them) are only imported for the job that runs, see load_pipeline
+PIPELINES = {'eth_etl': 'etl_pipeline', 'decode': 'decode_pipeline', 'price_fetch': 'price_fetch_pipeline'}
+# set ETH_TRACKER_DRY_START=1 to stop right before the job runs (start-up cost only, see bench_startup.py)
+DRY_START = os.getenv('ETH_TRACKER_DRY_START', '0') not in ('', '0')
 
 
-#loading API key
-load_dotenv()
-apis = {}
-apis['ETHERSCAN_API'] = os.getenv('ETHERSCAN_API')
-apis['RPC_PROVIDER'] = os.getenv('ETH_MAINNET_EXECUTION_RPC') # change this part for other EVM compatible rpc endpoints (*make sure if the downstream application is compatible regarding Etherscan side)
-apis['PUBLIC_LIBRARY'] = os.getenv('PUBLIC_LIBRARY')
-
-#configure w3 connection
-w3 = Web3(Web3.HTTPProvider(apis['RPC_PROVIDER']))
-assert w3.is_connected(), 'please check rpc provider configuration, web3 connection is not established'
-
-# parsing arguments
-args = arg_parser.get_args()
-
-
-# Configure logging
-if(not(os.path.exists('./logs'))):
-    os.makedirs('./logs')
-logging.basicConfig(filename=f'./logs/job_{args.job_id}.log', level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S', filemode='w')
-# for terminal outputs
-sh = logging.StreamHandler()
-formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
-sh.setFormatter(formatter)
-sh.setLevel(logging.INFO)
-logging.getLogger().addHandler(sh)
+def get_date():
+    # Format the date to 'day-month-year'
+    now = datetime.datetime.now()
+    return now.strftime('%d%m%y')
 
-logger = logging.getLogger(__name__)
 
-# run the job 
-pipeline = arg_parser.job_parser(args)
+def load_apis():
+    apis = {}
+    apis['ETHERSCAN_API'] = os.getenv('ETHERSCAN_API')
+    apis['RPC_PROVIDER'] = os.getenv('ETH_MAINNET_EXECUTION_RPC') # change this part for other EVM compatible rpc endpoints (*make sure if the downstream application is compatible regarding Etherscan side)
+    apis['PUBLIC_LIBRARY'] = os.getenv('PUBLIC_LIBRARY')
+    return apis
+
+
+def make_web3(apis):
+    #configure w3 connection (made on first use, jobs that do not need the node never connect)
+    import utils
+    return utils.Lazy_web3(apis['RPC_PROVIDER'])
+
+
+def load_pipeline(pipeline):
+    return importlib.import_module(PIPELINES[pipeline])
+
+
+def setup_logging(job_id):
+    # Configure logging (handlers are replaced, so a long running worker can switch the log file per job)
+    if(not(os.path.exists('./logs'))):
+        os.makedirs('./logs')
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+    fh = logging.FileHandler(f'./logs/job_{job_id}.log', mode='w')
+    fh.setFormatter(formatter)
+    root.addHandler(fh)
+    # for terminal outputs
+    sh = logging.StreamHandler()
+    sh.setFormatter(formatter)
+    sh.setLevel(logging.INFO)
+    root.addHandler(sh)
+
 
-if(pipeline == 'eth_etl'):
-    etl_pipeline.run_job(args = args, w3=w3, apis = apis, DATE=DATE)
-elif(pipeline == 'decode'):
-    decode_pipeline.run_job(args = args, w3=w3, apis = apis, DATE=DATE)
-elif(pipeline == 'price_fetch'):
-    price_fetch_pipeline.run_job(args = args, w3=w3, apis = apis, DATE=DATE)
+def dispatch(args, w3, apis, DATE):
+    # run the job 
+    pipeline = load_pipeline(arg_parser.job_parser(args))
+    if(DRY_START):
+        logger.info(f"dry start : {args.job} ready to run ({pipeline.__name__} loaded, node connected : {getattr(w3, 'connected', True)})")
+        return
+
+    pipeline.run_job(args = args, w3=w3, apis = apis, DATE=DATE)
+
+    logger.info(f"job succesfully done, please check job_{args.job_id}.log for the job log")
+
+
+def main(argv=None):
+    # parsing arguments first (-h and argument errors return before anything heavy is loaded)
+    args = arg_parser.get_args(argv)
+    setup_logging(args.job_id)
+
+    apis = load_apis()
+    w3 = make_web3(apis)
+
+    dispatch(args, w3, apis, get_date())
+
+
+logger = logging.getLogger(__name__)
 
-logger.info(f"job succesfully done, please check job_{args.job_id}.log for the job log")
+if __name__ == '__main__':
+    main()
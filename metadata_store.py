@@ -0,0 +1,272 @@
+import os, sys
+import json
+import glob
+import time
+import sqlite3
+import threading
+import logging
+import argparse
+from eth_utils import keccak
+import utils
+
+logger = logging.getLogger(__name__)
+
+
+DB_NAME = 'metadata.db'
+LRU_SIZE = 20000 # entries kept in memory in front of the sqlite file
+NEGATIVE_TTL = 7 * 24 * 3600 # seconds, unverified contracts are looked up again on etherscan after this (set 0 to always retry)
+BUSY_TIMEOUT = 30 # seconds, waiting time for a write lock held by another process
+
+# etherscan error messages
+UNVERIFIED_MSG = 'Contract source code not verified'
+RATE_LIMIT_MSG = 'Max rate limit reached'
+
+# legacy one-file-per-address cache directories
+LEGACY_DIRS = ['abis', 'bytecode', 'proxy_mapping', 'verified_source', 'calls']
+
+# columns added after the first release of the store : (table, column, definition)
+MIGRATIONS = [
+    ('proxies', 'observed_block', 'INTEGER'),
+]
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS abis (address TEXT PRIMARY KEY, abi TEXT, verified INTEGER, expires_at REAL, updated_at REAL)",
+    "CREATE TABLE IF NOT EXISTS code (address TEXT PRIMARY KEY, is_contract INTEGER, code_hash TEXT, updated_at REAL)",
+    "CREATE TABLE IF NOT EXISTS proxies (address TEXT PRIMARY KEY, impl_address TEXT, updated_at REAL, observed_block INTEGER)",
+    "CREATE TABLE IF NOT EXISTS sources (address TEXT PRIMARY KEY, result TEXT, verified INTEGER, expires_at REAL, updated_at REAL)",
+    "CREATE TABLE IF NOT EXISTS calls (address TEXT PRIMARY KEY, symbol TEXT, decimal INTEGER, updated_at REAL)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS events (address TEXT, topic0 TEXT, n_topics INTEGER, abi TEXT, PRIMARY KEY (address, topic0, n_topics))",
+    "CREATE INDEX IF NOT EXISTS events_by_topic ON events (topic0, n_topics)",
+]
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+class Metadata_store():
+    """
+    single-file (sqlite) store for ABIs, bytecode flags, proxy mappings, verified source code and token metadata,
+    with an in-process LRU in front of it. Replaces the ./abis, ./bytecode, ./proxy_mapping, ./verified_source and ./calls
+    directories (migrated once when the store is created).
+
+    negative results (unverified contracts) are kept with an expiry time instead of forever.
+    """
+    def __init__(self, root='./', lru_size=LRU_SIZE):
+        self.root = root
+        self.db_file = os.path.join(root, DB_NAME)
+        self.local = threading.local()
+        self.lru = utils.LRU_cache(lru_size)
+        conn = self.connect()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            for table, column, definition in MIGRATIONS:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        if self.get_meta('migrated') is None:
+            self.migrate_legacy_dirs()
+
+    def connect(self):
+        # one connection per thread
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            utils.check_dir(self.root)
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def _get(self, table, address, query):
+        key = (table, address.lower())
+        entry = self.lru.get(key)
+        if entry is None:
+            row = self.connect().execute(query, (address.lower(),)).fetchone()
+            if row is None:
+                return None
+            entry = row
+            self.lru.put(key, entry)
+        return entry
+
+    def _put(self, table, address, statement, values):
+        conn = self.connect()
+        with conn:
+            conn.execute(statement, (address.lower(),) + tuple(values))
+        self.lru.pop((table, address.lower()))
+
+    def get_meta(self, key):
+        row = self.connect().execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key, value):
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+    ### abis
+    def get_abi(self, address):
+        """
+        returns None if nothing (or only an expired negative entry) is stored,
+        otherwise (verified, abi). For unverified contracts abi holds the etherscan message.
+        """
+        entry = self._get('abis', address, "SELECT abi, verified, expires_at FROM abis WHERE address=?")
+        if entry is None:
+            return None
+        abi, verified, expires_at = entry
+        if not verified and (expires_at is None or expires_at < time.time()):
+            return None
+        return bool(verified), abi
+
+    def put_abi(self, address, abi, verified):
+        expires_at = None if verified else time.time() + NEGATIVE_TTL
+        self._put('abis', address, "INSERT OR REPLACE INTO abis VALUES (?, ?, ?, ?, ?)", (abi, int(verified), expires_at, time.time()))
+
+    ### bytecode (only the is-contract flag and the code hash are kept)
+    def get_code(self, address):
+        # returns None or (is_contract, code_hash)
+        entry = self._get('code', address, "SELECT is_contract, code_hash FROM code WHERE address=?")
+        if entry is None:
+            return None
+        return bool(entry[0]), entry[1]
+
+    def put_code(self, address, code):
+        code = bytes.fromhex(code[2:]) if isinstance(code, str) else bytes(code)
+        is_contract = len(code) > 0
+        code_hash = '0x' + keccak(code).hex()
+        self._put('code', address, "INSERT OR REPLACE INTO code VALUES (?, ?, ?, ?)", (int(is_contract), code_hash, time.time()))
+        return is_contract, code_hash
+
+    ### proxy mappings
+    def get_proxy(self, address):
+        entry = self._get('proxies', address, "SELECT impl_address, observed_block FROM proxies WHERE address=?")
+        return None if entry is None else entry[0]
+
+    def get_proxy_entry(self, address):
+        # None or (impl_address, block number the mapping was observed at (None for entries of older versions))
+        entry = self._get('proxies', address, "SELECT impl_address, observed_block FROM proxies WHERE address=?")
+        return None if entry is None else (entry[0], entry[1])
+
+    def put_proxy(self, address, impl_address, observed_block=None):
+        self._put('proxies', address, "INSERT OR REPLACE INTO proxies VALUES (?, ?, ?, ?)", (impl_address, time.time(), observed_block))
+
+    def put_proxies(self, results):
+        # {address: (impl_address, observed_block)} written in one transaction
+        conn = self.connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO proxies VALUES (?, ?, ?, ?)",
+                             [(address.lower(), impl_address, time.time(), observed_block) for address, (impl_address, observed_block) in results.items()])
+        for address in results:
+            self.lru.pop(('proxies', address.lower()))
+
+    ### verified source code (etherscan getsourcecode results)
+    def get_source(self, address):
+        # same convention as get_abi : None or (verified, result)
+        entry = self._get('sources', address, "SELECT result, verified, expires_at FROM sources WHERE address=?")
+        if entry is None:
+            return None
+        result, verified, expires_at = entry
+        if not verified and (expires_at is None or expires_at < time.time()):
+            return None
+        return bool(verified), json.loads(result)
+
+    def put_source(self, address, result, verified):
+        expires_at = None if verified else time.time() + NEGATIVE_TTL
+        self._put('sources', address, "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?)", (json.dumps(result), int(verified), expires_at, time.time()))
+
+    ### token metadata (erc20 symbol/decimals)
+    def get_call(self, address):
+        entry = self._get('calls', address, "SELECT symbol, decimal FROM calls WHERE address=?")
+        if entry is None:
+            return None
+        return {'symbol': entry[0], 'decimal': entry[1]}
+
+    def put_call(self, address, call_results):
+        self._put('calls', address, "INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?)", (call_results['symbol'], call_results['decimal'], time.time()))
+
+    def put_calls(self, results):
+        # {address: call_results} written in one transaction
+        conn = self.connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?)",
+                             [(address.lower(), call_results['symbol'], call_results['decimal'], time.time()) for address, call_results in results.items()])
+        for address in results:
+            self.lru.pop(('calls', address.lower()))
+
+    ### event topic index (topic0 -> event abi, per contract and merged over all contracts, see event_index.py)
+    def get_events(self, address):
+        # returns None if the contract was never indexed, otherwise {(topic0, n_topics): event abi json}
+        rows = self.connect().execute("SELECT topic0, n_topics, abi FROM events WHERE address=?", (address.lower(),)).fetchall()
+        if len(rows) == 0:
+            return None
+        return {(topic0, n_topics): abi for topic0, n_topics, abi in rows}
+
+    def put_events(self, address, entries):
+        # entries : [(topic0, n_topics, event abi json), ...]
+        conn = self.connect()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)", [(address.lower(), topic0, n_topics, abi) for topic0, n_topics, abi in entries])
+
+    def find_event(self, topic0, n_topics):
+        # event abi declared by any indexed contract for this (topic0, number of topics), None if unknown
+        row = self.connect().execute("SELECT abi FROM events WHERE topic0=? AND n_topics=? LIMIT 1", (topic0, n_topics)).fetchone()
+        return None if row is None else row[0]
+
+    ### one-time migration of the legacy cache directories
+    def migrate_legacy_dirs(self):
+        counts = {}
+        for folder in LEGACY_DIRS:
+            files = glob.glob(os.path.join(self.root, folder, '*.txt'))
+            counts[folder] = 0
+            for cached_file in files:
+                address = os.path.basename(cached_file)[:-len('.txt')]
+                try:
+                    with open(cached_file, 'r') as infile:
+                        value = json.load(infile)
+                except Exception as e:
+                    logger.error(f'skipping unreadable cache file {cached_file} : {e}')
+                    continue
+                if self._migrate_entry(folder, address, value):
+                    counts[folder] += 1
+        self.set_meta('migrated', time.time())
+        if sum(counts.values()) > 0:
+            logger.info(f'migrated legacy cache directories into {self.db_file} : {counts}')
+
+    def _migrate_entry(self, folder, address, value):
+        if folder == 'abis':
+            if not isinstance(value, str) or RATE_LIMIT_MSG in value:
+                return False
+            self.put_abi(address, value, verified = value != UNVERIFIED_MSG)
+        elif folder == 'bytecode':
+            self.put_code(address, value)
+        elif folder == 'proxy_mapping':
+            self.put_proxy(address, value)
+        elif folder == 'verified_source':
+            if isinstance(value, str) and RATE_LIMIT_MSG in value:
+                return False
+            self.put_source(address, value, verified = isinstance(value, list))
+        elif folder == 'calls':
+            self.put_call(address, value)
+        return True
+
+
+def get_store(root='./'):
+    # one store per process and location, shared by Eth_tracker and Transfer_Decoder
+    key = os.path.abspath(root)
+    with _STORES_LOCK:
+        if key not in _STORES:
+            _STORES[key] = Metadata_store(root)
+        return _STORES[key]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="metadata store for eth-tracker")
+    parser.add_argument("--root", "-r", type=str, default='./', help="eth-tracker root folder (location of the legacy cache directories)")
+    parser.add_argument("--migrate", "-m", action="store_true", help="(re-)import the legacy cache directories")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+    store = get_store(args.root)
+    if args.migrate:
+        store.migrate_legacy_dirs()
@@ -0,0 +1,57 @@
+import logging
+from eth_utils import to_checksum_address
+import abi_decoder
+import http_session
+
+logger = logging.getLogger(__name__)
+
+
+# Multicall3 is deployed at the same address on mainnet and most evm chains
+MULTICALL3_ADDRESS = '0xcA11bde05977b3631167028862bE2a173976CA11'
+AGGREGATE3_SELECTOR = '0x82ad56cb' # aggregate3((address,bool,bytes)[])
+BATCH_SIZE = 500 # calls per aggregate3 (kept below the gas limit of eth_call on common providers)
+
+
+def encode_aggregate3(calls):
+    # calls : [(target, calldata hex), ...], every call is allowed to fail
+    encoded = abi_decoder.abi_encode(['(address,bool,bytes)[]'], [[(to_checksum_address(target), True, bytes.fromhex(data[2:])) for target, data in calls]])
+    return AGGREGATE3_SELECTOR + encoded.hex()
+
+
+def decode_aggregate3(result):
+    # [(success, return data bytes), ...]
+    return [(success, bytes(return_data)) for success, return_data in abi_decoder.abi_decode(['(bool,bytes)[]'], bytes(result))[0]]
+
+
+def aggregate3(w3, calls, batch_size=BATCH_SIZE, block_identifier='latest'):
+    """
+    runs [(target, calldata hex), ...] through Multicall3 (one eth_call per batch_size calls).
+    returns [(success, return data bytes), ...] in the order of `calls`. Raises if a whole aggregate call fails.
+    """
+    results = []
+    for ii in range(0, len(calls), batch_size):
+        batch = calls[ii:ii+batch_size]
+        result = w3.eth.call({'to': MULTICALL3_ADDRESS, 'data': encode_aggregate3(batch)}, block_identifier)
+        results.extend(decode_aggregate3(result))
+    return results
+
+
+def batch_eth_calls(w3, calls, batch_size=BATCH_SIZE, block_identifier='latest'):
+    """
+    same interface as aggregate3 but sends the calls as JSON-RPC batches of eth_call (for chains without Multicall3).
+    """
+    rpc_provider = getattr(w3.provider, 'endpoint_uri', None)
+    results = []
+    for ii in range(0, len(calls), batch_size):
+        batch = calls[ii:ii+batch_size]
+        if rpc_provider is not None:
+            returned = http_session.post_batch(rpc_provider, [("eth_call", [{'to': target, 'data': data}, block_identifier]) for target, data in batch])
+            results.extend([(False, b'') if ret is None else (True, bytes.fromhex(ret[2:])) for ret in returned])
+        else:
+            for target, data in batch:
+                try:
+                    results.append((True, bytes(w3.eth.call({'to': target, 'data': data}, block_identifier))))
+                except Exception as e:
+                    logger.error(f'eth_call to {target} failed : {e}')
+                    results.append((False, b''))
+    return results
@@ -1,5 +1,4 @@
 import os,sys
-from Eth_ETL import Eth_tracker 
 import logging
 import pandas as pd
 sys.path.append('./decode')
@@ -54,11 +53,8 @@ def run_job(args, w3, apis, DATE):
         #initialize transfer decoder
         
 
-        result = td.decode_logs_csv(args.exported_file)
-        # save it
-        parsed= args.exported_file.split('/')
-        parent_dir = '/'.join(parsed[:-1])
-        result.to_csv(f'{parent_dir}/decoded_{file_name}', index=False)
+        # decoded and saved chunk by chunk
+        td.decode_logs_csv_to_file(args.exported_file, f'{parent_dir}/decoded_{file_name}')
         logger.info(f'decoding job successfully finished for {parent_dir}/decoded_{file_name}')
 
         
@@ -1,5 +1,6 @@
 import os,sys
 from Eth_ETL import Eth_tracker 
+import head_follower
 import logging
 import pandas as pd
 
@@ -42,7 +43,7 @@ def run_job(args, w3, apis, DATE):
     if args.job == "contracts_from":
         logger.info(f"extracting contracts that gets called from the input contract {args.addr} in block {args.blocknumber}")
         # fetch blockinfo
-        blockinfo = eth.fetch_blockinfo()
+        blockinfo = eth.fetch_blockinfo(full_transactions=True)
         # get transactions 
         txs = eth.get_transactions(blockinfo)
         # get contracts that were called 
@@ -53,7 +54,7 @@ def run_job(args, w3, apis, DATE):
     elif args.job == "contracts_to":
         logger.info(f"extracting contracts that make calls to the input contract {args.addr} in block {args.blocknumber}")
         # fetch blockinfo
-        blockinfo = eth.fetch_blockinfo()
+        blockinfo = eth.fetch_blockinfo(full_transactions=True)
         # get transactions 
         txs = eth.get_transactions(blockinfo)
         # get contracts that were called 
@@ -64,7 +65,7 @@ def run_job(args, w3, apis, DATE):
     elif args.job == "txs_from":
         logger.info(f"extracting transactions that were called from the input contract {args.addr} in block {args.blocknumber}")
          # fetch blockinfo
-        blockinfo = eth.fetch_blockinfo()
+        blockinfo = eth.fetch_blockinfo(full_transactions=True)
         # get transactions 
         txs = eth.get_transactions(blockinfo)
         # get contracts that were called 
@@ -73,7 +74,7 @@ def run_job(args, w3, apis, DATE):
     elif args.job == "txs_to":
         logger.info(f"extracting transactions that gets called from the input contract {args.addr} in block {args.blocknumber}")
         # fetch blockinfo
-        blockinfo = eth.fetch_blockinfo()
+        blockinfo = eth.fetch_blockinfo(full_transactions=True)
         # get transactions 
         txs = eth.get_transactions(blockinfo)
         # get contracts that were called 
@@ -113,7 +114,22 @@ def run_job(args, w3, apis, DATE):
             args.job=args.job_name
             logger.info(f'calling run_job function for job mode : {args.job_name}')
             args.blocknumber = block
-            run_job(args, w3, apis)
+            run_job(args, w3, apis, DATE)
+
+    elif args.job in ['traces_range', 'txs_range', 'contracts_range']:
+        # the end of the range is resolved once ('latest' -> current head)
+        end_block = w3.eth.block_number if args.end_block=='latest' else int(args.end_block)
+        logger.info(f"streaming the block range of start_block : {args.start_block}, end_block : {end_block} for {args.job}, contract(s) : {args.addr} in {args.pos} position")
+        eth.run_range(args.job, args.start_block, end_block, args.pos, read_ahead=args.read_ahead, ETHERSCAN_API=ETHERSCAN_API, cache_blocks=args.cache_blocks)
+
+    elif args.job=='follow':
+        state_file = args.state_file or f'{head_follower.STATE_DIR}/{args.job_name}_{eth.get_hash_of_list(CONTRACTS)[:16]}.json'
+        logger.info(f"following the chain head for {args.job_name}, contract(s) : {args.addr}, state : {state_file}")
+        follower = head_follower.Head_follower(eth, args.job_name, state_file, start_block=args.start_block, end_block=args.end_block,
+                                               confirmations=args.confirmations, poll_interval=args.poll_interval,
+                                               read_ahead=args.read_ahead, ETHERSCAN_API=ETHERSCAN_API, cache_blocks=args.cache_blocks,
+                                               max_attempts=args.max_attempts)
+        follower.run()
 
     elif args.job=='get_logs':
         logger.info(f"Applying a filter in the block range of start_block : {args.start_block}, end_block : {args.end_block}. getting logs for contract(s) : {args.addr}")
@@ -1,5 +1,4 @@
 import os,sys
-from Eth_ETL import Eth_tracker 
 import logging
 import pandas as pd
 sys.path.append('./price')
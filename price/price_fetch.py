@@ -4,7 +4,6 @@
 
 import os,sys
 from dotenv import load_dotenv
-from web3 import Web3 
 import numpy as np
 import pandas as pd
 import json
@@ -14,6 +13,8 @@ import hashlib
 import requests
 import logging
 import hexbytes
+import http_session
+import block_index
 
 
 
@@ -38,26 +39,12 @@ class Price_generic():
             os.makedirs(path)
 
     def unixtime_to_blocknum(self, unix_time):
-        # binary search
-        low, high = 0, self.w3.eth.get_block_number()
-
-        while low <= high:
-            mid = int((low + high) / 2)
-            mid_block_timestamp = self.w3.eth.get_block(mid).timestamp
-
-            if mid_block_timestamp == unix_time:
-                return mid
-            elif mid_block_timestamp < unix_time:
-                low = mid + 1
-            else:
-                high = mid - 1
-
-        return high  # Return the closest preceding block number
+        # shared block timestamp index (interpolation search over a persisted sparse table, see block_index.py)
+        return block_index.get_block_index(self.w3).unixtime_to_blocknum(unix_time)  # the closest preceding block number if there is no exact match
 
 
     def blocknum_to_unixtime(self, blocknum):
-        block = self.w3.eth.get_block(blocknum)
-        return block.timestamp
+        return block_index.get_block_index(self.w3).timestamp_of(blocknum)
 
 
     def unixtime_to_datetime(self, unix_timestamp):
@@ -153,7 +140,7 @@ class Defillama(Price_generic):
             params = {'searchWidth': '6h'} # default param of defillama
             headers = {'accept': 'application/json'}
 
-            res = requests.get(url, params=params, headers=headers)
+            res = http_session.get(url, params=params, headers=headers)
 
             if res.status_code == 200:
                 print("Success:", res.json())
@@ -187,7 +174,7 @@ class Defillama(Price_generic):
             params = {'searchWidth': '6h'} # default param of defillama
             headers = {'accept': 'application/json'}
 
-            res = requests.get(url, params=params, headers=headers)
+            res = http_session.get(url, params=params, headers=headers)
 
             if res.status_code == 200:
                 print("Success:", res.json())
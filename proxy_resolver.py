@@ -0,0 +1,168 @@
+import threading
+import logging
+from eth_utils import to_checksum_address, to_hex
+import http_session
+import block_cache
+import contract_cache
+
+logger = logging.getLogger(__name__)
+
+
+OZ_SLOT = '0x7050c9e0f4ca769c69bd3a8ef740bc37934f8e2c036e5a723fd8ee048ed3f8c3' # openzeppelin upgradable template (keccak256("org.zeppelinos.proxy.implementation"))
+ERC1967_SLOT = '0x360894a13ba1a3210667c828492db98dca3e2076cc3735a920a3ca505d382bbc' # bytes32(uint256(keccak256("eip1967.proxy.implementation")) - 1)
+GET_IMPLEMENTATION_SELECTOR = '0xaaf10f42' # getImplementation() (UUPS)
+ZERO_ADDRESS = contract_cache.ZERO_ADDRESS
+
+PROXY_REFRESH_BLOCKS = 50000 # cached mappings older than this (~1 week) are resolved again, proxies can be upgraded
+BATCH_SIZE = 100 # addresses per JSON-RPC batch (3 requests per address)
+
+_RESOLVERS = {}
+_RESOLVERS_LOCK = threading.Lock()
+
+
+def word_to_address(word):
+    # address held in a 32-byte word (storage slot or abi-encoded return value), None unless the word is exactly
+    # 32 bytes with the upper 12 bytes zero and a non-zero address (fallbacks answering unknown selectors return other data)
+    if not isinstance(word, str) or len(word) != 66 or not word.startswith('0x'):
+        return None
+    try:
+        if int(word[2:26], 16) != 0 or int(word[26:], 16) == 0:
+            return None
+    except ValueError:
+        return None
+    return to_checksum_address('0x' + word[26:])
+
+
+class Proxy_resolver():
+    """
+    proxy -> implementation mappings for many addresses at once, shared by Eth_tracker and Transfer_Decoder.
+
+    the openzeppelin slot, the erc-1967 slot and getImplementation() (UUPS) of every address are read in one JSON-RPC batch
+    together with eth_blockNumber. Addresses that stay unresolved are looked up in the etherscan verified source code
+    (Implementation field) if a source fetcher is given.
+    mappings are stored with the block they were observed at and resolved again after PROXY_REFRESH_BLOCKS blocks.
+    """
+    def __init__(self, w3, store, refresh_blocks=PROXY_REFRESH_BLOCKS):
+        self.w3 = w3
+        self.store = store
+        self.refresh_blocks = int(refresh_blocks)
+
+    @property
+    def rpc_provider(self):
+        # read on use, a lazily connected web3 (utils.Lazy_web3) is not touched when every mapping is cached
+        return getattr(self.w3.provider, 'endpoint_uri', None)
+
+    def is_fresh(self, entry):
+        if entry is None:
+            return False
+        impl_addr, observed_block = entry
+        if observed_block is None: # mappings cached before observed blocks were recorded
+            return False
+        return block_cache.get_block_cache(self.w3).get_head() - observed_block < self.refresh_blocks
+
+    def resolve(self, addr, etherscan_source=None):
+        return self.resolve_many([addr], etherscan_source)[addr]
+
+    def resolve_many(self, addrs, etherscan_source=None):
+        """
+        returns {addr: implementation address} (ZERO_ADDRESS if no known proxy pattern matched).
+        etherscan_source(addr) should return the etherscan getsourcecode result (or None).
+        """
+        results = {}
+        stale = []
+        for addr in dict.fromkeys(addrs):
+            entry = self.store.get_proxy_entry(addr)
+            if self.is_fresh(entry):
+                logger.info(f"using cached bytecode (implementation contract) {entry[0]}")
+                results[addr] = entry[0]
+            else:
+                stale.append(addr)
+
+        for ii in range(0, len(stale), BATCH_SIZE):
+            batch = stale[ii:ii+BATCH_SIZE]
+            observed_block, on_chain = self.read_slots(batch)
+            resolved = {}
+            for addr in batch:
+                impl_addr = on_chain.get(addr)
+                if impl_addr is None and etherscan_source is not None:
+                    impl_addr = self.etherscan_implementation(addr, etherscan_source)
+                if impl_addr is None:
+                    impl_addr = ZERO_ADDRESS
+                resolved[addr] = (impl_addr, observed_block)
+                results[addr] = impl_addr
+            logger.info(f'saving proxy mappings for {len(resolved)} addresses (block {observed_block})')
+            self.store.put_proxies(resolved)
+        return results
+
+    def read_slots(self, addrs):
+        """
+        one JSON-RPC batch : eth_blockNumber + (oz slot, erc-1967 slot, getImplementation()) per address.
+        returns (block number, {addr: implementation address or None})
+        """
+        calls = [("eth_blockNumber", [])]
+        for addr in addrs:
+            calls.append(("eth_getStorageAt", [addr, OZ_SLOT, 'latest']))
+            calls.append(("eth_getStorageAt", [addr, ERC1967_SLOT, 'latest']))
+            calls.append(("eth_call", [{'to': addr, 'data': GET_IMPLEMENTATION_SELECTOR}, 'latest']))
+        if self.rpc_provider is not None:
+            returned = http_session.post_batch(self.rpc_provider, calls)
+        else:
+            returned = [self.single_call(method, params) for method, params in calls]
+
+        observed_block = int(returned[0], 16) if isinstance(returned[0], str) else returned[0]
+        found = {}
+        for jj, addr in enumerate(addrs):
+            oz, erc1967, uups = returned[1+3*jj:4+3*jj]
+            impl_addr = None
+            for pattern, word in [('openzeppelin upgradable template', oz), ('erc-1967 slot check', erc1967), ('UUPS getImplementation', uups)]:
+                impl_addr = word_to_address(word)
+                if impl_addr is not None:
+                    logger.info(f"found a valid impl addresss for {addr} through {pattern}")
+                    break
+            found[addr] = impl_addr
+        return observed_block, found
+
+    def single_call(self, method, params):
+        # fallback for providers without an http endpoint
+        try:
+            if method == "eth_blockNumber":
+                return self.w3.eth.block_number
+            elif method == "eth_getStorageAt":
+                return to_hex(self.w3.eth.get_storage_at(params[0], params[1]))
+            return to_hex(self.w3.eth.call(params[0]))
+        except Exception as e:
+            logger.info(f'{method} {params} failed : {e}')
+            return None
+
+    def etherscan_implementation(self, addr, etherscan_source):
+        res = etherscan_source(addr)
+        if res is None:
+            return None
+        impl_addr = res[0].get('Implementation', '')
+        if len(impl_addr) == 42 and int(impl_addr, 16) != 0:
+            logger.info(f"found a valid impl addresss from etherscan verified source codes")
+            return to_checksum_address(impl_addr)
+        return None
+
+    def prefetch(self, addrs, etherscan_source=None):
+        """
+        resolves, in one go, the addresses whose cached ABI looks like a proxy (see contract_cache.is_proxy_abi)
+        and that have no fresh mapping, so that decoding later only hits the cache.
+        """
+        proxies = []
+        for addr in dict.fromkeys(addrs):
+            cached = self.store.get_abi(addr)
+            if cached is not None and cached[0] and contract_cache.is_proxy_abi(cached[1]) and not self.is_fresh(self.store.get_proxy_entry(addr)):
+                proxies.append(to_checksum_address(addr))
+        if len(proxies):
+            logger.info(f'resolving {len(proxies)} proxy contracts in batches')
+            self.resolve_many(proxies, etherscan_source)
+
+
+def get_proxy_resolver(w3, store):
+    # one resolver per process, web3 instance and metadata store
+    key = (id(w3), id(store))
+    with _RESOLVERS_LOCK:
+        if key not in _RESOLVERS:
+            _RESOLVERS[key] = Proxy_resolver(w3, store)
+        return _RESOLVERS[key]
@@ -0,0 +1,244 @@
+import os, sys
+import csv
+import json
+import time
+import sqlite3
+import threading
+import logging
+import argparse
+from eth_utils import keccak
+import utils
+import abi_decoder
+
+logger = logging.getLogger(__name__)
+
+
+DB_NAME = 'signatures.db'
+LRU_SIZE = 50000 # selectors kept in memory in front of the sqlite file
+NEGATIVE_TTL = 3 * 24 * 3600 # seconds, unknown selectors are looked up again on 4byte after this (set 0 to always retry)
+BUSY_TIMEOUT = 30 # seconds
+IMPORT_BATCH = 50000 # rows per transaction during bulk imports
+
+# rank of signatures taken from verified ABIs (always preferred over 4byte entries, which are ranked by their 4byte id)
+VERIFIED_RANK = -1
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS signatures (selector TEXT, kind TEXT, text_signature TEXT, rank INTEGER, PRIMARY KEY (selector, text_signature))",
+    "CREATE TABLE IF NOT EXISTS misses (selector TEXT PRIMARY KEY, expires_at REAL)",
+]
+
+_DBS = {}
+_DBS_LOCK = threading.Lock()
+
+
+def selector_of(text_signature, kind):
+    # 4-byte function selector or 32-byte event topic of a text signature
+    digest = keccak(text=text_signature).hex()
+    return '0x' + (digest[:8] if kind == 'function' else digest)
+
+
+def normalize_selector(selector):
+    # '0x' + lowercase hex, None if it is neither a 4-byte function selector nor a 32-byte event topic
+    selector = str(selector).strip().lower()
+    if not selector.startswith('0x'):
+        selector = '0x' + selector
+    if len(selector) not in (10, 66):
+        return None
+    try:
+        int(selector, 16)
+    except ValueError:
+        return None
+    return selector
+
+
+def kind_of(selector):
+    # selector has to be normalized (see normalize_selector)
+    if len(selector) == 10:
+        return 'function'
+    if len(selector) == 66:
+        return 'event'
+    raise ValueError(f'{selector} is neither a function selector nor an event topic')
+
+
+class Signature_db():
+    """
+    local (sqlite) copy of 4byte.directory : 4-byte function selectors and 32-byte event topics -> text signatures.
+
+    a selector can map to several signatures (collisions). They are ranked, the lowest rank wins :
+    signatures from verified ABIs first, then 4byte entries by their id (the earliest submission is usually the genuine one,
+    later colliding entries are mostly spam). Selectors that 4byte does not know are remembered for NEGATIVE_TTL seconds.
+    """
+    def __init__(self, root='./', lru_size=LRU_SIZE):
+        self.root = root
+        self.db_file = os.path.join(root, DB_NAME)
+        self.local = threading.local()
+        self.lru = utils.LRU_cache(lru_size)
+        conn = self.connect()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def connect(self):
+        # one connection per thread
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            utils.check_dir(self.root)
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def lookup(self, selector):
+        """
+        returns (known, text_signature) :
+        (False, None) the selector was never looked up, (True, None) it is a cached miss, (True, text) the best ranked signature.
+        malformed selectors are reported as misses (they can never match a signature).
+        """
+        selector = normalize_selector(selector)
+        if selector is None:
+            return True, None
+        entry = self.lru.get(selector)
+        if entry is None:
+            conn = self.connect()
+            row = conn.execute("SELECT text_signature FROM signatures WHERE selector=? ORDER BY rank LIMIT 1", (selector,)).fetchone()
+            if row is not None:
+                entry = (True, row[0])
+            else:
+                miss = conn.execute("SELECT expires_at FROM misses WHERE selector=?", (selector,)).fetchone()
+                if miss is None or miss[0] < time.time():
+                    return False, None
+                entry = (True, None)
+            self.lru.put(selector, entry)
+        return entry
+
+    def lookup_all(self, selector):
+        # every known signature of the selector, best ranked first
+        selector = normalize_selector(selector)
+        if selector is None:
+            return []
+        rows = self.connect().execute("SELECT text_signature FROM signatures WHERE selector=? ORDER BY rank", (selector,)).fetchall()
+        return [row[0] for row in rows]
+
+    def put_signatures(self, entries):
+        """
+        entries : [(selector, text_signature, rank), ...]. Entries whose text signature does not hash to the selector are dropped.
+        returns the number of stored entries.
+        """
+        rows = []
+        for selector, text_signature, rank in entries:
+            selector = normalize_selector(selector)
+            if selector is None:
+                continue
+            kind = kind_of(selector)
+            if selector_of(text_signature, kind) != selector:
+                continue
+            rows.append((selector, kind, text_signature, int(rank)))
+        conn = self.connect()
+        with conn:
+            # keep the better (lower) rank when a signature is imported twice
+            conn.executemany("INSERT INTO signatures VALUES (?, ?, ?, ?) ON CONFLICT (selector, text_signature) DO UPDATE SET rank=MIN(rank, excluded.rank)", rows)
+            conn.executemany("DELETE FROM misses WHERE selector=?", [(row[0],) for row in rows])
+        for row in rows:
+            self.lru.pop(row[0])
+        return len(rows)
+
+    def put_miss(self, selector):
+        selector = normalize_selector(selector)
+        if selector is None:
+            return
+        conn = self.connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO misses VALUES (?, ?)", (selector, time.time() + NEGATIVE_TTL))
+        self.lru.pop(selector)
+
+    def import_abi(self, parsed_abi):
+        # function and event signatures of a verified ABI
+        entries = []
+        for entry in parsed_abi:
+            kind = entry.get('type', 'function')
+            if kind not in ['function', 'event']:
+                continue
+            text_signature = f"{entry['name']}({','.join(abi_decoder.abi_type(param) for param in entry.get('inputs', []))})"
+            entries.append((selector_of(text_signature, kind), text_signature, VERIFIED_RANK))
+        return self.put_signatures(entries)
+
+    def import_dump(self, dump_file):
+        """
+        bulk import of a signature dump. Supported formats :
+        - csv with a header containing text_signature and one of hex_signature/selector/bytes_signature (optional id column used as rank)
+        - json, either a list of 4byte api results ({id, text_signature, hex_signature}) or {"results": [...]},
+          or a plain {selector: text_signature or [text_signature, ...]} mapping
+        """
+        count = 0
+        batch = []
+        for entry in _read_dump(dump_file):
+            batch.append(entry)
+            if len(batch) >= IMPORT_BATCH:
+                count += self.put_signatures(batch)
+                batch = []
+        count += self.put_signatures(batch)
+        logger.info(f'imported {count} signatures from {dump_file}')
+        return count
+
+
+def _read_dump(dump_file):
+    if dump_file.endswith('.csv'):
+        with open(dump_file, 'r', newline='') as infile:
+            for ii, row in enumerate(csv.DictReader(infile)):
+                selector = row.get('hex_signature') or row.get('selector') or row.get('bytes_signature')
+                text_signature = row.get('text_signature')
+                if not selector or not text_signature:
+                    continue
+                if not selector.startswith('0x'):
+                    selector = '0x' + selector
+                yield selector, text_signature, row.get('id') or ii
+    else:
+        with open(dump_file, 'r') as infile:
+            data = json.load(infile)
+        if isinstance(data, dict) and 'results' in data:
+            data = data['results']
+        if isinstance(data, list):
+            for ii, row in enumerate(data):
+                yield row['hex_signature'], row['text_signature'], row.get('id', ii)
+        else:
+            for selector, text_signatures in data.items():
+                if isinstance(text_signatures, str):
+                    text_signatures = [text_signatures]
+                for ii, text_signature in enumerate(text_signatures):
+                    yield selector, text_signature, ii
+
+
+def get_signature_db(root='./'):
+    # one database per process and location, shared by Eth_tracker and Transfer_Decoder
+    key = os.path.abspath(root)
+    with _DBS_LOCK:
+        if key not in _DBS:
+            _DBS[key] = Signature_db(root)
+        return _DBS[key]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="offline function/event signature database for eth-tracker")
+    parser.add_argument("--root", "-r", type=str, default='./', help="eth-tracker root folder (location of signatures.db)")
+    parser.add_argument("--import_dump", "-i", type=str, nargs='*', default=[], help="signature dump files (.csv or .json) to import")
+    parser.add_argument("--import_abis", "-a", action="store_true", help="import the signatures of all verified ABIs in metadata.db")
+    parser.add_argument("--lookup", "-l", type=str, nargs='*', default=[], help="selectors/topics to look up")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s', datefmt='%d-%b-%y %H:%M:%S')
+    sig_db = get_signature_db(args.root)
+    for dump_file in args.import_dump:
+        sig_db.import_dump(dump_file)
+    if args.import_abis:
+        import metadata_store
+        store = metadata_store.get_store(args.root)
+        count = 0
+        for (abi,) in store.connect().execute("SELECT abi FROM abis WHERE verified=1"):
+            try:
+                count += sig_db.import_abi(json.loads(abi))
+            except Exception as e:
+                logger.error(f'skipping unreadable abi : {e}')
+        logger.info(f'imported {count} signatures from verified ABIs')
+    for selector in args.lookup:
+        print(selector, sig_db.lookup_all(selector))
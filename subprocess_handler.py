@@ -1,16 +1,25 @@
 import os,sys
+import json
+import time
+import shlex
+import signal
+import queue
+import threading
 import subprocess
-import numpy as np
-import argparse 
-import concurrent.futures
+import argparse
 
 
 parser = argparse.ArgumentParser(description="batch job parser for eth-tracker")
 parser.add_argument("--batch_script", "-b",  type=str, required=True, help="name of the batch script. Each line in the script should be one of eth-tracker jobs")
 parser.add_argument("--num_process", "-n", type=str, required=True, help="number of subprocesses to spawn")
+parser.add_argument("--daemon", "-d", action="store_true", help="send the jobs to a running job daemon (python job_daemon.py serve) instead of spawning subprocesses")
+parser.add_argument("--port", "-p", type=int, default=None, help="port of the job daemon")
+parser.add_argument("--journal", type=str, default=None, help="progress journal (defaults to <batch_script>.journal). Lines marked as done there are skipped, so an interrupted batch resumes where it stopped")
+parser.add_argument("--retry_failed", "-r", action="store_true", help="also run again the lines that failed in a previous run")
 
-args = parser.parse_args()   
+args = parser.parse_args()
 batch_script = args.batch_script
+journal_file = args.journal or f'{batch_script}.journal'
 
 # read in batch_job.txt file
 process_n = int(args.num_process)
@@ -20,35 +29,168 @@ process_n = int(args.num_process)
 with open(batch_script, 'r') as infile:
      lines = [line.strip() for line in infile.readlines()]
 
-for ii, line in enumerate(lines):
-    lines[ii] = line + ' -j ' + str(ii%process_n)
+# every line gets its own job id (its line index), so every job writes its own log file (./logs/job_<line index>.log)
+jobs = [(ii, line + ' -j ' + str(ii)) for ii, line in enumerate(lines) if line != '']
+
+
+class Journal():
+    """
+    append-only json lines file with the status of each batch line ({"index", "line", "status", ...}).
+    every entry is flushed and fsynced before the next job is handed out, the last entry of a line wins.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, 'r') as infile:
+                for raw in infile:
+                    try:
+                        entry = json.loads(raw)
+                    except ValueError: # partially written last entry of a crashed run
+                        continue
+                    self.status[(entry['index'], entry['line'])] = entry['status']
+        self.handle = open(path, 'a')
+
+    def get(self, index, line):
+        return self.status.get((index, line))
+
+    def write(self, index, line, status, **info):
+        entry = dict(index=index, line=line, status=status, time=time.time(), **info)
+        with self.lock:
+            if self.handle.closed: # a worker finishing after the handler closed the journal (second Ctrl-C)
+                return
+            self.handle.write(json.dumps(entry) + '\n')
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+            self.status[(index, line)] = status
+
+    def close(self):
+        with self.lock:
+            self.handle.close()
+
+
+KILL_TIMEOUT = 10 # seconds the killed jobs get to exit on SIGTERM before they are sent SIGKILL
+
+# running subprocesses (pid -> Popen), so a second Ctrl-C can stop them instead of leaving them orphaned
+running = {}
+# lines taken by a worker whose final status is not written yet (Thread.join is not reliable once interrupted by Ctrl-C)
+busy = set()
+running_lock = threading.Lock()
+
 
-# multiprocessing using subprocesses         
 def run_subprocess(command):
     """Function to run a subprocess."""
-    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    return stdout, stderr
+    # own session : a Ctrl-C in the terminal stops the handler from starting new jobs but does not kill the running ones
+    process = subprocess.Popen(shlex.split(command), stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    with running_lock:
+        running[process.pid] = process
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        with running_lock:
+            running.pop(process.pid, None)
+    return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+
+def kill_running(sig):
+    with running_lock:
+        processes = list(running.values())
+    for process in processes:
+        try:
+            os.killpg(process.pid, sig) # the job's own session/process group, children of the job included
+        except ProcessLookupError:
+            pass
+    return len(processes)
+
+
+def wait_for_busy(timeout=None):
+    # True once every taken line has its final status in the journal
+    deadline = None if timeout is None else time.time() + timeout
+    while deadline is None or time.time() < deadline:
+        with running_lock:
+            if not busy:
+                return True
+        time.sleep(0.1)
+    return False
+
+
+def run_on_daemon(command):
+    result = job_daemon.submit_lines([command], port=args.port or job_daemon.PORT)[0]
+    if(result is None):
+        return 1, '', 'no answer from the job daemon'
+    return (0 if result['status']=='ok' else 1), '', result.get('error', '')
+
 
-def chunkify(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+def worker(pending, journal, run, stop):
+    # idle workers pull the next line as soon as they are done (no chunks, one slow job only occupies its own slot)
+    while True:
+        with running_lock: # stop is set under the same lock, no line is taken after the handler saw `busy` empty
+            if stop.is_set():
+                return
+            try:
+                ii, command = pending.get_nowait()
+            except queue.Empty:
+                return
+            busy.add(ii)
+        journal.write(ii, lines[ii], 'started')
+        start = time.time()
+        try:
+            returncode, stdout, stderr = run(command)
+        except Exception as e:
+            returncode, stdout, stderr = 1, '', repr(e)
+        status = 'done' if returncode==0 else 'failed'
+        if(status=='failed' and (stop.is_set() or returncode < 0)):
+            status = 'interrupted' # killed by a signal or failed while the batch was interrupted : run again on the next run (not skipped like failed lines)
+        journal.write(ii, lines[ii], status, returncode=returncode, elapsed=time.time() - start, stderr=stderr[-2000:] if status!='done' else '')
+        with running_lock:
+            busy.discard(ii)
+        print(f"[{status}] line {ii} ({time.time() - start:.1f}s) : {lines[ii]}")
+        if(status=='failed'):
+            print("stderr:", stderr.strip()[-2000:])
 
-# n_chunks = len(lines) // process_n + (1 if len(lines) % process_n else 0)
-chunk_size = max(len(lines) // process_n, 1)
 
-with concurrent.futures.ProcessPoolExecutor(max_workers=process_n) as executor:
-    # Split lines into chunks
-    for chunk in chunkify(lines, chunk_size):
-        futures = [executor.submit(run_subprocess, line.split(' ')) for line in chunk]
-    
-        # Wait for all futures to complete
-        for future in concurrent.futures.as_completed(futures):
-            stdout, stderr = future.result()  # This will block until the future is complete
-            # Process the results here (for example, printing them)
-            print("stdout:", stdout.decode().strip())
-            print("stderr:", stderr.decode().strip())
+journal = Journal(journal_file)
+skip = ['done', 'failed'] if not args.retry_failed else ['done']
+pending = queue.Queue()
+n_skipped = 0
+for ii, command in jobs:
+    if(journal.get(ii, lines[ii]) in skip):
+        n_skipped += 1
+    else:
+        pending.put((ii, command))
+print(f'{pending.qsize()} jobs to run, {n_skipped} already processed according to {journal_file}')
 
+if(args.daemon):
+    import job_daemon
+    run = run_on_daemon
+else:
+    run = run_subprocess
 
+stop = threading.Event()
+threads = [threading.Thread(target=worker, args=(pending, journal, run, stop), daemon=True) for _ in range(process_n)]
+for thread in threads:
+    thread.start()
+try:
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=0.5)
+except KeyboardInterrupt:
+    # running jobs are finished, lines that were not started stay pending for the next run
+    print('interrupted, waiting for the running jobs to finish (the batch resumes from the journal on the next run)')
+    with running_lock:
+        stop.set()
+    try:
+        wait_for_busy()
+    except KeyboardInterrupt:
+        # second Ctrl-C : stop the running jobs, their lines are marked as interrupted and run again on the next run
+        print(f'stopping {kill_running(signal.SIGTERM)} running job(s)')
+        if(not wait_for_busy(KILL_TIMEOUT)):
+            kill_running(signal.SIGKILL)
+            wait_for_busy(1)
+journal.close()
 
+n_done = sum(1 for ii, command in jobs if journal.get(ii, lines[ii]) == 'done')
+n_failed = sum(1 for ii, command in jobs if journal.get(ii, lines[ii]) == 'failed')
+print(f'{n_done} of {len(jobs)} jobs done, {n_failed} failed' + (' (rerun with --retry_failed)' if n_failed else ''))
+sys.exit(0 if n_done==len(jobs) else 1)
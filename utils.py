@@ -2,6 +2,10 @@ import os,sys
 import json
 from decimal import Decimal
 import datetime
+import threading
+from collections import OrderedDict
+import pandas as pd
+import block_index
 
 
 def convert_to_decimal(obj):
@@ -27,37 +31,114 @@ def check_dir(path):
         os.makedirs(path)
 
 
+class LRU_cache():
+    """
+    small thread-safe LRU mapping with bounded size (least recently used entries are evicted first)
+    """
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class Row_accumulator():
+    """
+    collects rows (dicts) into column lists and builds the DataFrame once at the end, instead of pd.concat per row.
+    columns keep the order in which they first appear (same as concatenating single-row frames), missing values are None.
+    """
+    def __init__(self):
+        self.columns = {}
+        self.n_rows = 0
+
+    def append(self, row):
+        for key, value in row.items():
+            if key not in self.columns:
+                self.columns[key] = [None] * self.n_rows
+            self.columns[key].append(value)
+        self.n_rows += 1
+        for column in self.columns.values():
+            if len(column) < self.n_rows:
+                column.append(None)
+
+    def __len__(self):
+        return self.n_rows
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns, index=pd.RangeIndex(self.n_rows))
+
+
+
+### lazily connected web3
+
+class Lazy_web3():
+    """
+    stands in for a Web3 instance. web3 is imported, the provider created and the connection checked on the first
+    attribute access (w3.eth, w3.provider, ...), so jobs that never touch the node (cached decoding, price_current)
+    start without importing web3 or a round trip to the node.
+    """
+    def __init__(self, rpc_provider):
+        self.rpc_provider = rpc_provider
+        self._w3 = None
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if self._w3 is None:
+            with self._lock:
+                if self._w3 is None:
+                    from web3 import Web3
+                    import http_session
+                    w3 = Web3(http_session.make_web3_provider(self.rpc_provider)) # shares the pooled keep-alive session with the other rpc/rest callers
+                    assert w3.is_connected(), 'please check rpc provider configuration, web3 connection is not established'
+                    self._w3 = w3
+        return self._w3
+
+    @property
+    def connected(self):
+        # True once the connection was made (does not connect)
+        return self._w3 is not None
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set on the wrapper itself
+        return getattr(self.connect(), name)
+
+
 
 ### handling times
 
 class time_handler():
     def __init__(self, w3):
-        self.w3 = w3
-        assert self.w3.is_connected(), 'please check rpc provider configuration, web3 connection is not established'
+        self.w3 = w3 # connection is checked on first use (see Lazy_web3)
 
 
     
     def unixtime_to_blocknum(self, unix_time):
-        # binary search
-        low, high = 0, self.w3.eth.get_block_number()
-
-        while low <= high:
-            mid = int((low + high) / 2)
-            mid_block_timestamp = self.w3.eth.get_block(mid).timestamp
-
-            if mid_block_timestamp == unix_time:
-                return mid
-            elif mid_block_timestamp < unix_time:
-                low = mid + 1
-            else:
-                high = mid - 1
-
-        return high  # Return the closest preceding block number
+        # shared block timestamp index (interpolation search over a persisted sparse table, see block_index.py)
+        return block_index.get_block_index(self.w3).unixtime_to_blocknum(unix_time)  # the closest preceding block number if there is no exact match
 
 
     def blocknum_to_unixtime(self, blocknum):
-        block = self.w3.eth.get_block(blocknum)
-        return block.timestamp
+        return block_index.get_block_index(self.w3).timestamp_of(blocknum)
 
 
     def unixtime_to_datetime(self, unix_timestamp):